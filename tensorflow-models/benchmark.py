@@ -0,0 +1,111 @@
+import argparse
+import importlib
+import time
+
+import tensorflow as tf
+
+from evaluation import Evaluator, load_feature_extractor
+from trainer import block
+
+MODELS = {
+    'dcgan': ('dcgan', 'DCGAN'),
+    'conditional_gan': ('conditional_gan', 'ConditionalGAN'),
+    'wassertein_gan': ('wassertein_gan', 'WasserteinGAN'),
+    'improved_wassertein_gan': ('improved_wassertein_gan', 'ImprovedWasserteinGAN'),
+    'emoti_gan': ('emoti-gan', 'EmotiGAN'),
+}
+
+
+def steps_per_second(train_step, iterator, steps=100, warmup=5):
+    # trace_time covers tracing and, with XLA, compiling the step
+    start = time.time()
+    block(train_step(iterator))
+    trace_time = time.time() - start
+
+    for _ in range(warmup - 1):
+        block(train_step(iterator))
+
+    start = time.time()
+    for _ in range(steps):
+        outputs = train_step(iterator)
+    block(outputs)
+    elapsed = time.time() - start
+
+    return {'trace_time': trace_time, 'steps_per_second': steps / elapsed}
+
+
+def time_to_target_fid(gan, target, fid_samples=2000, max_steps=10000, check_interval=500):
+    # Trains until the FID of the generator (see evaluation.py) drops to `target`. FID is
+    # compared rather than a loss since the critic losses of the Lipschitz modes measure
+    # different things (the gradient penalty is part of the 'gp' loss). `seconds` is
+    # training wall time, the evaluations themselves are not counted.
+    extractor = load_feature_extractor(gan.config.FID_DATASET, gan.config.FEATURE_DIR)
+    evaluator = Evaluator(extractor, tf.nest.flatten(gan.train_data)[0], num_samples=fid_samples)
+    generate = lambda count: gan.generate_evaluation_images(gan.evaluation_inputs(count))
+
+    seconds = 0.
+    fid = None
+    for step in range(1, max_steps + 1):
+        start = time.time()
+        outputs = gan.train_step(gan.iterator)
+        if step % check_interval == 0:
+            block(outputs)
+            seconds += time.time() - start
+            fid = evaluator.evaluate(generate)
+            if fid <= target:
+                return {'steps': step, 'seconds': seconds, 'fid': fid}
+        else:
+            seconds += time.time() - start
+    return {'steps': None, 'seconds': seconds, 'fid': fid}
+
+
+def build_model(name, **overrides):
+    module_name, class_name = MODELS[name]
+    module = importlib.import_module(module_name)
+    # config is read when the model is built, so overrides have to be set before that
+    for key, value in overrides.items():
+        setattr(module.config, key, value)
+    return getattr(module, class_name)()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model', choices=sorted(MODELS) + ['all'])
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--lipschitz-modes', nargs='+', choices=['clip', 'gp', 'spectral'],
+                        help="compare critic modes of the Wasserstein models")
+    parser.add_argument('--target-fid', type=float, default=None,
+                        help="also measure the training time until the FID drops to target")
+    parser.add_argument('--fid-samples', type=int, default=2000)
+    parser.add_argument('--jit', choices=['off', 'on', 'both'], default='off',
+                        help="compile the generator and critic updates with XLA; 'both' reports the speedup")
+    args = parser.parse_args()
+
+    models = sorted(MODELS) if args.model == 'all' else [args.model]
+    jit_modes = {'off': [False], 'on': [True], 'both': [False, True]}[args.jit]
+
+    runs = [{}]
+    if args.lipschitz_modes:
+        runs = [{'LIPSCHITZ_MODE': mode} for mode in args.lipschitz_modes]
+
+    for model in models:
+        for overrides in runs:
+            baseline = None
+            for jit_compile in jit_modes:
+                name = " ".join([model] + list(overrides.values()) + (['xla'] if jit_compile else []))
+                gan = build_model(model, JIT_COMPILE=jit_compile, **overrides)
+                result = steps_per_second(gan.train_step, gan.iterator, steps=args.steps, warmup=args.warmup)
+                print("{} : compile {:.2f}s, {:.2f} steps/sec".format(name, result['trace_time'], result['steps_per_second']))
+
+                if jit_compile and not gan.jit_compile:
+                    print("{} : XLA fell back to graph mode".format(name))
+                if baseline is None:
+                    baseline = result['steps_per_second']
+                else:
+                    print("{} : {:.2f}x speedup over graph mode".format(name, result['steps_per_second'] / baseline))
+
+                if args.target_fid is not None:
+                    result = time_to_target_fid(gan, args.target_fid, fid_samples=args.fid_samples)
+                    print("{} : FID {} reached after {} steps in {:.2f}s (last FID {})".format(
+                        name, args.target_fid, result['steps'], result['seconds'], result['fid']))
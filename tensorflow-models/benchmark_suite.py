@@ -0,0 +1,206 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import tensorflow as tf
+
+from benchmark import MODELS, steps_per_second
+from trainer import block
+
+# Offline throughput / memory benchmark of every model. Each model is built on random
+# uint8 data of the shape it trains on (no dataset download, nothing written under
+# /content) and every (model, batch size) pair runs in a fresh process, so its peak RSS
+# is its own. Results are written as JSON and can be compared against an earlier run.
+PHASES = ('data', 'critic', 'generator')
+
+
+def synthetic_data(name, config, size, seed=0):
+    rng = np.random.default_rng(seed)
+    images = rng.integers(0, 256, (size, config.IMG_HEIGHT, config.IMG_WIDTH, config.CHANNELS), dtype=np.uint8)
+    if name == 'conditional_gan':
+        return images, rng.integers(0, config.NUM_LABELS, (size, 1), dtype=np.int32)
+    if name == 'emoti_gan':
+        return images, rng.integers(0, config.NUM_WORDS, (size, config.MAX_LEN), dtype=np.int32)
+    return images
+
+
+def build_synthetic_model(name, size, **overrides):
+    module_name, class_name = MODELS[name]
+    module = importlib.import_module(module_name)
+    for key, value in overrides.items():
+        setattr(module.config, key, value)
+    data = synthetic_data(name, module.config, size)
+
+    class SyntheticModel(getattr(module, class_name)):
+        def load_data(self):
+            if isinstance(data, tuple):
+                # EmotiGAN samples its conditions from the padded sequences
+                self.padded_sequences = data[1]
+            return data
+
+        def embedding_matrix(self, embedding_dim):
+            # stands in for the word2vec rows of EmotiGAN
+            return np.random.default_rng(0).normal(size=(module.config.NUM_WORDS, embedding_dim)).astype(np.float32)
+
+    return SyntheticModel()
+
+
+def phase_latency(gan, steps):
+    # Runs the three phases of train_step as separate functions, so they can be timed
+    # on their own. Compared to the fused train_step this adds one dispatch per phase.
+    times = {phase: [] for phase in PHASES}
+    # the first step traces every phase and is not counted
+    for step in range(steps + 1):
+        start = time.perf_counter()
+        inputs = gan.data_fn(gan.iterator)
+        block(inputs)
+        data_end = time.perf_counter()
+
+        for i in range(gan.config.CRITIC_SIZE):
+            block(gan.critic_fn(tf.constant(i), inputs))
+        critic_end = time.perf_counter()
+
+        block(gan.generator_fn(inputs))
+        generator_end = time.perf_counter()
+
+        if step > 0:
+            times['data'].append(data_end - start)
+            times['critic'].append(critic_end - data_end)
+            times['generator'].append(generator_end - critic_end)
+
+    return {phase: summarize(times[phase]) for phase in PHASES}
+
+
+def summarize(seconds):
+    milliseconds = 1000 * np.asarray(seconds)
+    return {
+        'mean_ms': float(milliseconds.mean()),
+        'p50_ms': float(np.percentile(milliseconds, 50)),
+        'p90_ms': float(np.percentile(milliseconds, 90)),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_benchmark(name, batch_size, steps, warmup, phase_steps, dataset_size, jit_compile):
+    # runs in its own process, see run_isolated
+    with tempfile.TemporaryDirectory() as directory:
+        overrides = {
+            'BATCH_SIZE': batch_size,
+            'JIT_COMPILE': jit_compile,
+            'TENSORBOARD': False,
+            'METRICS_DIR': os.path.join(directory, 'metrics/'),
+            'CHECKPOINT_DIR': os.path.join(directory, 'checkpoints/'),
+        }
+        module = importlib.import_module(MODELS[name][0])
+        size = max(dataset_size, module.config.CRITIC_SIZE * batch_size)
+
+        start = time.time()
+        gan = build_synthetic_model(name, size, **overrides)
+        build_time = time.time() - start
+
+        result = steps_per_second(gan.train_step, gan.iterator, steps=steps, warmup=warmup)
+        phases = phase_latency(gan, phase_steps)
+
+        gan.sample_writer.close()
+        gan.metrics_writer.close()
+
+    return {
+        'model': name,
+        'batch_size': batch_size,
+        'critic_size': module.config.CRITIC_SIZE,
+        'jit_compile': gan.jit_compile,
+        'build_time': build_time,
+        'trace_time': result['trace_time'],
+        'steps_per_second': result['steps_per_second'],
+        'images_per_second': result['steps_per_second'] * batch_size,
+        'phases': phases,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_isolated(*args):
+    # a fresh interpreter per run keeps peak RSS, TF state and the patched configs apart
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_benchmark, *args).result()
+
+
+def environment():
+    return {
+        'tensorflow': tf.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'devices': [device.device_type for device in tf.config.list_physical_devices()],
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Returns the runs whose steps/sec dropped more than `tolerance` (a fraction) below
+    # the baseline run with the same model, batch size and compile mode.
+    key = lambda run: (run['model'], run['batch_size'], run['jit_compile'])
+    baseline_runs = {key(run): run for run in baseline['runs']}
+
+    regressions = []
+    for run in results['runs']:
+        reference = baseline_runs.get(key(run))
+        if reference is None:
+            continue
+        ratio = run['steps_per_second'] / reference['steps_per_second']
+        run['baseline_ratio'] = ratio
+        if ratio < 1 - tolerance:
+            regressions.append(run)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline training benchmark on synthetic data")
+    parser.add_argument('--models', nargs='+', choices=sorted(MODELS), default=sorted(MODELS))
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[32, 64, 128])
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--phase-steps', type=int, default=20)
+    parser.add_argument('--dataset-size', type=int, default=4096)
+    parser.add_argument('--jit', action='store_true', help="compile the generator and critic updates with XLA")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', default=None, help="JSON written by an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="fraction of the baseline steps/sec a run may lose before it is a regression")
+    args = parser.parse_args()
+
+    results = {'environment': environment(), 'runs': []}
+    for name in args.models:
+        for batch_size in args.batch_sizes:
+            run = run_isolated(name, batch_size, args.steps, args.warmup, args.phase_steps, args.dataset_size, args.jit)
+            results['runs'].append(run)
+
+            phases = " ".join("{} {:.1f}ms".format(phase, run['phases'][phase]['p50_ms']) for phase in PHASES)
+            print("{} batch {} : trace {:.2f}s, {:.2f} steps/sec, {} | peak RSS {:.0f}MB".format(
+                name, batch_size, run['trace_time'], run['steps_per_second'], phases, run['peak_rss_mb']))
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for run in regressions:
+            print("Regression: {} batch {} at {:.2f}x the baseline steps/sec".format(
+                run['model'], run['batch_size'], run['baseline_ratio']))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("Wrote {}".format(args.output))
+
+    sys.exit(1 if regressions else 0)
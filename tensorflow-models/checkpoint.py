@@ -0,0 +1,58 @@
+import time
+
+import tensorflow as tf
+
+
+class AsyncCheckpointManager:
+    # Saves the given trackables (models, optimizer, RNG, step counter ...) every
+    # `every_steps` steps or `every_seconds` seconds, whichever comes first. Variables are
+    # copied to host memory on the calling thread and written to disk in the background,
+    # so the training loop only pays for the copy.
+    def __init__(self, directory, every_steps=None, every_seconds=None, max_to_keep=3, **trackables):
+        self.directory = directory
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+
+        self.checkpoint = tf.train.Checkpoint(**trackables)
+        self.manager = tf.train.CheckpointManager(self.checkpoint, directory, max_to_keep=max_to_keep)
+        self.options = tf.train.CheckpointOptions(experimental_enable_async_checkpoint=True)
+
+        self.last_step = 0
+        self.last_time = time.time()
+
+    def restore(self):
+        # restores the latest checkpoint (if any) into the trackables and returns its step,
+        # or None when starting fresh
+        latest = self.manager.latest_checkpoint
+        if latest is None:
+            return None
+
+        # fails if a variable of the model is missing from the checkpoint, i.e. it was written
+        # by a different architecture; starting from partly random weights would go unnoticed
+        self.checkpoint.restore(latest).assert_existing_objects_matched()
+        self.last_step = int(latest.rsplit('-', 1)[-1])
+        print("Restored checkpoint {}".format(latest))
+        return self.last_step
+
+    def should_save(self, step):
+        if self.every_steps is not None and step - self.last_step >= self.every_steps:
+            return True
+        if self.every_seconds is not None and time.time() - self.last_time >= self.every_seconds:
+            return True
+        return False
+
+    def maybe_save(self, step):
+        if self.should_save(step):
+            self.save(step)
+
+    def save(self, step):
+        if step == self.last_step and self.manager.latest_checkpoint is not None:
+            return
+
+        self.manager.save(checkpoint_number=step, options=self.options)
+        self.last_step = step
+        self.last_time = time.time()
+
+    def close(self):
+        # blocks until the last asynchronous write has finished
+        self.checkpoint.sync()
@@ -1,9 +1,14 @@
 import tensorflow as tf
 from tensorflow.keras.datasets import mnist
 import numpy as np
-import matplotlib.pyplot as plt
 
-class config:
+from conditional_sampling import LabelRequestQueue, generate_per_label
+from input_pipeline import memmap_array
+from losses import MinimaxLoss
+from shards import ShardedImages
+from trainer import GANTrainer, TrainerConfig
+
+class config(TrainerConfig):
     IMG_HEIGHT = 28
     IMG_WIDTH = 28
     CHANNELS = 1
@@ -13,40 +18,76 @@ class config:
     LEARNING_RATE = 0.001
     BETA_1 = 0.9
     NUM_LABELS = 10
-    
-    LOG_INTERVAL = 500
-    SAMPLE_INTERVAL = 1000
-    
-    
-class ConditionalGAN:
+
+    CHECKPOINT_DIR = '/content/checkpoints/conditional_gan/'
+    METRICS_DIR = '/content/metrics/conditional_gan/'
+    PROFILE_DIR = '/content/profile/conditional_gan/'
+    EXPORT_DIR = '/content/export/conditional_gan/'
+
+
+class ConditionalGAN(GANTrainer):
+    SAMPLE_GRID = (2, 5)
+    SAMPLE_PATH = "/content/image_at_{:04d}.png"
+    # the generator is frozen during the discriminator update
+    FREEZE_GENERATOR = True
+
     def __init__(self):
-        
         self.image_shape = (config.IMG_HEIGHT, config.IMG_WIDTH, config.CHANNELS)
-        self.optimizer = tf.keras.optimizers.Adam(config.LEARNING_RATE, config.BETA_1)
-        
-        print("Loading Data...")
-        (self.train_images, self.train_labels), (_, _) = mnist.load_data()
-        
-        print("Normalizing Data...")
-        self.train_images = self.train_images / 127.5 - 1.
-        
-        self.train_images = np.expand_dims(self.train_images, axis=3)
-        print("Data Shape : ", self.train_images.shape)
-        print()
-        
-        print("Building Generator...")
-        self.generator = self.build_generator()
-        
-        print("Building Discriminator...")
-        self.discriminator = self.build_discriminator()
-        
-        print("Building GAN...")
-        self.gan = self.build_gan()
-        
-        self.generator_losses = []
-        self.discriminator_losses = []
-        
-    
+        super().__init__(config)
+
+    def load_data(self):
+        if config.SHARDS_DIR is not None:
+            train_images = ShardedImages(config.SHARDS_DIR)
+            train_labels = [int(label) for label in train_images.labels]
+        elif config.MMAP_DIR is not None:
+            train_images = memmap_array(config.MMAP_DIR + 'mnist_train_images.npy', lambda: mnist.load_data()[0][0])
+            train_labels = memmap_array(config.MMAP_DIR + 'mnist_train_labels.npy', lambda: mnist.load_data()[0][1])
+        else:
+            (train_images, train_labels), (_, _) = mnist.load_data()
+        # labels are the conditions of both models, shaped like their label inputs
+        return train_images, np.asarray(train_labels, dtype=np.int32).reshape(-1, 1)
+
+    def build_optimizer(self):
+        return tf.keras.optimizers.Adam(config.LEARNING_RATE, config.BETA_1)
+
+    def build_loss(self):
+        return MinimaxLoss()
+
+    def sample_inputs(self, count):
+        # one sample per label
+        Z = tf.random.normal((count, config.LATENT_DIM))
+        labels = tf.reshape(tf.range(count), (-1, 1))
+        return [Z, labels]
+
+    def evaluation_inputs(self, count):
+        # labels drawn uniformly, the sample grid only covers one of each
+        Z = tf.random.normal((count, config.LATENT_DIM))
+        labels = tf.random.uniform((count, 1), maxval=config.NUM_LABELS, dtype=tf.int32)
+        return [Z, labels]
+
+    @tf.function(input_signature=[tf.TensorSpec((None, config.LATENT_DIM), tf.float32), tf.TensorSpec((None, 1), tf.int32)])
+    def generate_batch(self, noise, labels):
+        # uint8 images, traced once for every batch size
+        images = self.generator([noise, labels], training=False)
+        return tf.cast(tf.clip_by_value(tf.round(127.5 * images + 127.5), 0, 255), tf.uint8)
+
+    def generate_images(self, noise, labels):
+        return self.generate_batch(noise, labels).numpy()
+
+    def label_queue(self, batch_size=256, seed=None):
+        # batches a mixed stream of (label, count) requests, see conditional_sampling.py
+        return LabelRequestQueue(self.generate_images, config.LATENT_DIM, batch_size=batch_size, seed=seed,
+                                 image_shape=self.image_shape, num_labels=config.NUM_LABELS)
+
+    def generate_per_label(self, count, seed=None):
+        # (NUM_LABELS, count, H, W, C) uint8 images from one generator call
+        return generate_per_label(self.generate_images, config.LATENT_DIM, config.NUM_LABELS, count, seed=seed)
+
+    def serving_metadata(self):
+        metadata = super().serving_metadata()
+        metadata.update(conditioning='label', num_labels=config.NUM_LABELS)
+        return metadata
+
     def build_generator(self):
         
         noise_input = tf.keras.Input(shape=(config.LATENT_DIM,))
@@ -63,8 +104,8 @@ class ConditionalGAN:
             tf.keras.layers.LeakyReLU(),
             tf.keras.layers.BatchNormalization(),
             tf.keras.layers.Dense(np.prod(self.image_shape)),
-            tf.keras.layers.Activation('tanh'),
-            tf.keras.layers.Reshape(self.image_shape)
+            tf.keras.layers.Activation('tanh', dtype='float32'),
+            tf.keras.layers.Reshape(self.image_shape, dtype='float32')
         ])
         
         # creates a 100 dimensional embedding vector associated with the label
@@ -93,7 +134,7 @@ class ConditionalGAN:
             tf.keras.layers.LeakyReLU(),
             tf.keras.layers.Dropout(0.5),
             tf.keras.layers.Dense(1),
-            tf.keras.layers.Activation('sigmoid')
+            tf.keras.layers.Activation('sigmoid', dtype='float32')
         ])
         
         embedding_output = tf.keras.layers.Embedding(config.NUM_LABELS, np.prod(self.image_shape))(label_input)
@@ -105,115 +146,8 @@ class ConditionalGAN:
         prediction = model(model_input)
         
         return tf.keras.Model([image_input, label_input], prediction)
-    
-    def build_gan(self):
-        self.discriminator.compile(optimizer=self.optimizer, loss='binary_crossentropy', metrics=['accuracy'])
-        self.discriminator.trainable = False
-        
-        noise_input = tf.keras.Input(shape=(config.LATENT_DIM,))
-        label_input = tf.keras.Input(shape=(1,), dtype='int32')
-        
-        fake_images = self.generator([noise_input, label_input])
-        
-        prediction = self.discriminator([fake_images, label_input])
-        
-        model = tf.keras.Model([noise_input, label_input], prediction)
-        model.compile(optimizer=self.optimizer, loss='binary_crossentropy')
-        
-        return model
 
-    def train_generator_step(self, Z, real_labels, valid_labels):
-        g_loss = self.gan.train_on_batch([Z, real_labels], valid_labels)
-        return g_loss
-    
-    def train_discriminator_step(self, Z, real_images, real_labels, valid_labels, fake_labels):
-        fake_images = self.generator.predict([Z, real_labels])
-        d_real_loss = self.discriminator.train_on_batch([real_images, real_labels], valid_labels)
-        d_fake_loss = self.discriminator.train_on_batch([fake_images, real_labels], fake_labels)
-        d_loss, accuracy = 0.5 * np.add(d_real_loss, d_fake_loss)
-        return d_loss, accuracy
-    
-    @tf.function
-    def train_step(self):
-        Z = np.random.normal(0, 1, size=(config.BATCH_SIZE, config.LATENT_DIM))
-        real_images, real_labels = self.random_images_with_labels()
-        valid_labels = np.ones((config.BATCH_SIZE, 1))
-        fake_labels = np.zeros((config.BATCH_SIZE, 1))
-        
-        d_loss, accuracy = self.train_discriminator_step(Z, real_images, real_labels, valid_labels, fake_labels)
-        
-        g_loss = self.train_generator_step(Z, real_labels, valid_labels)
-        
-        return g_loss, d_loss, accuracy
-    
-    def train(self):
-        for epoch in range(config.EPOCHS):   
-            g_loss, d_loss, accuracy = self.train_step()
-            
-            if (epoch + 1) % config.LOG_INTERVAL == 0:
-                self.log_progress(epoch+1, g_loss, d_loss, accuracy=accuracy)
-
-            if (epoch + 1) % config.SAMPLE_INTERVAL == 0:
-                self.sample_images(epoch+1)
-                
-            self.generator_losses.append(g_loss)
-            self.discriminator_losses.append(d_loss)
-            
-        self.generate_progress_graph()
-    
-    def random_images_with_labels(self):
-        indexes = np.random.randint(0, self.train_images.shape[0], size=config.BATCH_SIZE)
-        images = self.train_images[indexes]
-        labels = self.train_labels[indexes]
-        return images, labels
-    
-    def log_progress(self, epoch, g_loss, d_loss, accuracy=None):
-        print("Epoch {}/{} :".format(epoch+1, config.EPOCHS))
-        print(
-            "    [G Loss - {:.4f}]\t[D Loss - {:.4f}".format(g_loss, d_loss), end='')
-        if accuracy is not None:
-            print(" | D Acc - {:.4f}]".format(accuracy))
-        else:
-            print("]")
-            
-    def generate_progress_graph(self):
-        fig, axes = plt.subplots(1, 2, sharex=False, sharey=False, figsize=(24, 16))
-        axes[0].plot(self.generator_losses, color='purple',label='Generator Loss')
-        axes[1].plot(self.discriminator_losses, color='b', label='Discriminator Loss')
-
-        axes[0].set_title("Generator Loss")
-        axes[1].set_title("Discriminator Loss")
-
-        axes[0].set_xlabel("Epochs")
-        axes[1].set_xlabel("Epochs")
-
-        axes[0].set_ylabel("Loss")
-        axes[1].set_ylabel("Loss")
-        plt.savefig('/content/progress_graph.png', bbox_inches='tight')
-        plt.close(fig)
-    
-    def sample_images(self, epoch):
-        rows, cols = 2, 5
-        
-        Z = np.random.normal(0, 1, size=(rows * cols, config.LATENT_DIM))
-        labels = np.arange(rows * cols).reshape(-1, 1)
-        
-        fake_images = self.generator.predict([Z, labels])
-        fake_images = 0.5 * fake_images + 0.5
-        
-        fig, axes = plt.subplots(rows, cols, sharex=True, sharey=True, figsize=(10, 10))
-
-        count = 0
-
-        for i in range(rows):
-          for j in range(cols):
-            axes[i, j].imshow(fake_images[count, :, :, 0], cmap='gray')
-            axes[i, j].axis('off')
-            count += 1
-        
-        plt.savefig("/content/image_at_{:04d}.png".format(epoch), bbox_inches='tight')
-        plt.close(fig)
 
 if __name__ == "__main__":
     cgan = ConditionalGAN()
-    cgan.train()
\ No newline at end of file
+    cgan.train()
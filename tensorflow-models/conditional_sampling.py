@@ -0,0 +1,115 @@
+import collections
+
+import numpy as np
+
+# Batched sampling of class-conditional generators. `generate(noise, labels)` returns the
+# uint8 images of a float32 (n, latent_dim) noise batch and an int32 (n, 1) label batch,
+# e.g. ConditionalGAN.generate_images or serve.Generator of an exported ConditionalGAN.
+
+
+class LabelRequest:
+    def __init__(self, queue, label, count):
+        self.queue = queue
+        self.label = label
+        self.count = count
+        self.remaining = count
+        self.parts = []
+
+    def done(self):
+        return self.remaining == 0
+
+    def result(self):
+        if not self.done():
+            raise RuntimeError("{} of {} images of label {} are still queued, call flush() first".format(
+                self.remaining, self.count, self.label))
+        if not self.parts:
+            return self.queue.empty_result()
+        return self.parts[0] if len(self.parts) == 1 else np.concatenate(self.parts)
+
+
+class LabelRequestQueue:
+    # Takes a mixed stream of (label, count) requests and generates them in full batches
+    # of `batch_size` samples, mixing labels within a batch and splitting requests across
+    # batches where needed. Every request gets back exactly its own images.
+    #   queue = LabelRequestQueue(gan.generate_images, config.LATENT_DIM)
+    #   requests = [queue.submit(label, count) for label, count in stream]
+    #   queue.flush()
+    #   images = [request.result() for request in requests]
+    # Requests of 0 images get a (0, H, W, C) array; `image_shape` is learned from the
+    # first batch when it is not given. With `num_labels`, labels outside [0, num_labels)
+    # are rejected by submit() instead of failing the batch they would end up in.
+    def __init__(self, generate, latent_dim, batch_size=256, seed=None, image_shape=None, num_labels=None):
+        self.generate = generate
+        self.latent_dim = latent_dim
+        self.batch_size = batch_size
+        self.num_labels = num_labels
+        self.empty = None if image_shape is None else np.empty((0,) + tuple(image_shape), dtype=np.uint8)
+        self.rng = np.random.default_rng(seed)
+        # [request, samples not scheduled yet]
+        self.pending = collections.deque()
+        self.pending_count = 0
+        self.batches = 0
+
+    def submit(self, label, count):
+        if count < 0:
+            raise ValueError("count must be at least 0, got {}".format(count))
+        if self.num_labels is not None and not 0 <= label < self.num_labels:
+            raise ValueError("label must be between 0 and {}, got {}".format(self.num_labels - 1, label))
+        request = LabelRequest(self, label, count)
+        if count > 0:
+            self.pending.append([request, count])
+            self.pending_count += count
+        while self.pending_count >= self.batch_size:
+            self.run_batch(self.batch_size)
+        return request
+
+    def flush(self):
+        # generates what is left, the last batch may be smaller than batch_size
+        while self.pending_count > 0:
+            self.run_batch(min(self.batch_size, self.pending_count))
+
+    def empty_result(self):
+        if self.empty is None:
+            # nothing generated yet, a single sample gives the image shape (without drawing
+            # from self.rng, so the noise of the requests does not change)
+            noise = np.zeros((1, self.latent_dim), dtype=np.float32)
+            self.empty = self.generate(noise, np.zeros((1, 1), dtype=np.int32))[:0]
+        return self.empty
+
+    def run_batch(self, size):
+        labels = np.empty((size, 1), dtype=np.int32)
+        pieces = []
+        filled = 0
+        for request, left in self.pending:
+            if filled == size:
+                break
+            take = min(left, size - filled)
+            labels[filled:filled + take] = request.label
+            pieces.append((request, filled, take))
+            filled += take
+
+        noise = self.rng.standard_normal((size, self.latent_dim), dtype=np.float32)
+        images = self.generate(noise, labels)
+
+        # the queue only changes once the batch is generated, so if generate raises the
+        # requests stay pending and a later flush() serves them
+        for request, start, take in pieces:
+            request.parts.append(images[start:start + take])
+            request.remaining -= take
+            if take == self.pending[0][1]:
+                self.pending.popleft()
+            else:
+                self.pending[0][1] -= take
+        self.pending_count -= size
+        if self.empty is None:
+            self.empty = images[:0]
+        self.batches += 1
+
+
+def generate_per_label(generate, latent_dim, num_labels, count, seed=None):
+    # `count` samples of every label from a single generator call, returned as
+    # (num_labels, count, H, W, C)
+    labels = np.repeat(np.arange(num_labels, dtype=np.int32), count).reshape(-1, 1)
+    noise = np.random.default_rng(seed).standard_normal((num_labels * count, latent_dim), dtype=np.float32)
+    images = generate(noise, labels)
+    return images.reshape((num_labels, count) + images.shape[1:])
@@ -0,0 +1,34 @@
+import tensorflow as tf
+
+STRATEGIES = (None, 'mirrored')
+
+
+def split_cpu(num_devices):
+    # exposes the host CPU as `num_devices` logical devices so MirroredStrategy can run
+    # one replica per device without GPUs; only possible before TF initialises its devices
+    cpu = tf.config.list_physical_devices('CPU')[0]
+    try:
+        tf.config.set_logical_device_configuration(cpu, [tf.config.LogicalDeviceConfiguration()] * num_devices)
+    except RuntimeError:
+        if len(tf.config.list_logical_devices('CPU')) != num_devices:
+            raise
+    return [device.name for device in tf.config.list_logical_devices('CPU')]
+
+
+def get_strategy(name=None, cpu_replicas=None):
+    if name not in STRATEGIES:
+        raise ValueError("Unknown strategy {}, expected one of {}".format(name, STRATEGIES))
+
+    if name is None:
+        # the default strategy: a single replica, strategy.run just calls the function
+        return tf.distribute.get_strategy()
+
+    if cpu_replicas:
+        devices = split_cpu(cpu_replicas)
+        return tf.distribute.MirroredStrategy(devices, cross_device_ops=tf.distribute.ReductionToOneDevice())
+    return tf.distribute.MirroredStrategy()
+
+
+def reduce_mean(strategy, values):
+    # per-replica losses are already means over each replica's shard of the batch
+    return tf.nest.map_structure(lambda value: strategy.reduce(tf.distribute.ReduceOp.MEAN, value, axis=None), values)
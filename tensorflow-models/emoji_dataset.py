@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from compositing import composite_on_white
+
+# bump whenever decoding changes what ends up in the cache
+CACHE_VERSION = 2
+
+
+def decode_emoji(image_path):
+    # runs in a worker process; images without an alpha channel are skipped (None)
+    with Image.open(image_path) as image:
+        image = np.asarray(image)
+    if image.shape[-1] != 4:
+        return None
+    return image
+
+
+def cache_paths(cache_dir, emoji_json, images_dir):
+    # the key covers the emoji.json contents, the image set and the cache version, so
+    # a new emoji-data checkout or a decoder change never reuses a stale cache
+    key = hashlib.sha1(emoji_json)
+    key.update(os.path.basename(os.path.normpath(images_dir)).encode())
+    key.update(str(CACHE_VERSION).encode())
+    prefix = os.path.join(cache_dir, 'emoji-{}'.format(key.hexdigest()[:16]))
+    return prefix + '-images.npy', prefix + '-names.json'
+
+
+def load_emoji_dataset(emoji_json_path, images_dir, cache_dir, workers=None):
+    # Returns (images, short_names) for every emoji with an RGBA google image. images is
+    # a uint8 (N, H, W, 3) array; the cache is read into memory (a few tens of MB) so
+    # training gathers batches on the device instead of through the Python memmap path
+    # of input_pipeline.gather_function, which is only meant for MMAP_DIR / SHARDS_DIR.
+    with open(emoji_json_path, 'rb') as f:
+        emoji_json = f.read()
+    images_path, names_path = cache_paths(cache_dir, emoji_json, images_dir)
+
+    if os.path.exists(images_path) and os.path.exists(names_path):
+        print("\tLoading cached dataset {}".format(images_path))
+        with open(names_path) as f:
+            names = json.load(f)
+        return np.load(images_path), names
+
+    emojis = [emoji for emoji in json.loads(emoji_json) if emoji['has_img_google']]
+    image_paths = [os.path.join(images_dir, emoji['image']) for emoji in emojis]
+
+    print("\tDecoding {} images over {} processes...".format(len(image_paths), workers or os.cpu_count()))
+    with ProcessPoolExecutor(workers) as executor:
+        decoded = list(executor.map(decode_emoji, image_paths, chunksize=64))
+
+    names = [emoji['short_name'] for emoji, image in zip(emojis, decoded) if image is not None]
+    images = np.stack([image for image in decoded if image is not None], axis=0)
+    del decoded
+    images = composite_on_white(images)
+
+    # written under temporary names first so an interrupted run never leaves a partial cache
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(images_path + '.tmp.npy', images)
+    with open(names_path + '.tmp', 'w') as f:
+        json.dump(names, f)
+    os.replace(images_path + '.tmp.npy', images_path)
+    os.replace(names_path + '.tmp', names_path)
+
+    return images, names
@@ -0,0 +1,184 @@
+import argparse
+import csv
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.datasets import cifar10, fashion_mnist, mnist
+
+from input_pipeline import normalize_images
+
+# Offline FID-style evaluation. Instead of Inception weights, features come from a small
+# classifier trained locally on MNIST, Fashion-MNIST or CIFAR-10 (its penultimate layer).
+# Feature statistics are accumulated batch by batch (StreamingMoments), so the number of
+# evaluated samples does not change memory use. Extractors are trained once and saved:
+#   python evaluation.py mnist --feature-dir /content/features/
+FEATURE_DATASETS = {
+    'mnist': (mnist.load_data, (28, 28, 1)),
+    'fashion_mnist': (fashion_mnist.load_data, (28, 28, 1)),
+    'cifar10': (cifar10.load_data, (32, 32, 3)),
+}
+FEATURE_DIM = 128
+
+
+def build_feature_extractor(image_shape, num_classes=10):
+    # returns (classifier, extractor); the extractor shares the classifier's layers up
+    # to the feature layer
+    image_input = tf.keras.Input(shape=image_shape)
+    x = image_input
+    for filters in (32, 64, 128):
+        x = tf.keras.layers.Conv2D(filters, 3, padding='SAME', activation='relu')(x)
+        x = tf.keras.layers.MaxPooling2D()(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    features = tf.keras.layers.Dense(FEATURE_DIM, activation='relu')(x)
+    prediction = tf.keras.layers.Dense(num_classes, dtype='float32')(features)
+
+    classifier = tf.keras.Model(image_input, prediction)
+    extractor = tf.keras.Model(image_input, tf.cast(features, tf.float32))
+    return classifier, extractor
+
+
+def load_feature_extractor(dataset, feature_dir, epochs=5, batch_size=256):
+    # trains the extractor of `dataset` on its first use and reuses the saved weights after
+    load_data, image_shape = FEATURE_DATASETS[dataset]
+    classifier, extractor = build_feature_extractor(image_shape)
+
+    path = os.path.join(feature_dir, '{}.weights.h5'.format(dataset))
+    if os.path.exists(path):
+        classifier.load_weights(path)
+        return extractor
+
+    print("Training {} feature extractor...".format(dataset))
+    (train_images, train_labels), _ = load_data()
+    train_images = normalize_images(train_images).numpy()
+    classifier.compile(optimizer='adam', metrics=['accuracy'],
+                       loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True))
+    classifier.fit(train_images, train_labels.reshape(-1), batch_size=batch_size, epochs=epochs, verbose=2)
+
+    os.makedirs(feature_dir, exist_ok=True)
+    classifier.save_weights(path + '.tmp.h5')
+    os.replace(path + '.tmp.h5', path)
+    return extractor
+
+
+def adapt_images(images, image_shape):
+    # [-1, 1] batches of any size / channel count to the extractor input
+    height, width, channels = image_shape
+    if images.shape[-1] != channels:
+        images = tf.tile(images, [1, 1, 1, 3]) if channels == 3 else tf.reduce_mean(images, axis=-1, keepdims=True)
+    if tuple(images.shape[1:3]) != (height, width):
+        images = tf.image.resize(images, (height, width))
+    return images
+
+
+class StreamingMoments:
+    # Mean and covariance of a stream of (n, d) feature batches, merged batch by batch
+    # (Chan et al.) in float64; only d + d * d numbers are kept.
+    def __init__(self, dim):
+        self.count = 0
+        self.mean = np.zeros(dim)
+        self.scatter = np.zeros((dim, dim))
+
+    def update(self, batch):
+        batch = np.asarray(batch, dtype=np.float64)
+        count = len(batch)
+        if count == 0:
+            return
+        mean = batch.mean(axis=0)
+        centered = batch - mean
+
+        total = self.count + count
+        delta = mean - self.mean
+        self.scatter += centered.T @ centered + np.outer(delta, delta) * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+    def covariance(self):
+        return self.scatter / max(self.count - 1, 1)
+
+
+def frechet_distance(mean1, covariance1, mean2, covariance2):
+    # ||m1 - m2||^2 + Tr(C1 + C2 - 2 (C1 C2)^(1/2)). Tr((C1 C2)^(1/2)) is computed as the
+    # sum of the square roots of the eigenvalues of C1^(1/2) C2 C1^(1/2), which is
+    # symmetric, so only eigh is needed.
+    values, vectors = np.linalg.eigh(covariance1)
+    root = (vectors * np.sqrt(np.clip(values, 0, None))) @ vectors.T
+    product = np.linalg.eigvalsh(root @ covariance2 @ root)
+    trace_root = np.sqrt(np.clip(product, 0, None)).sum()
+    return float(np.sum(np.square(mean1 - mean2)) + np.trace(covariance1) + np.trace(covariance2) - 2 * trace_root)
+
+
+class Evaluator:
+    # Frechet distance between the extractor features of real images and of generated
+    # ones. `real_images` is anything make_dataset accepts as images (uint8 arrays, memory
+    # mapped arrays, shards.ShardedImages); its statistics are computed on the first call.
+    def __init__(self, extractor, real_images, num_samples=10000, batch_size=500, seed=0):
+        self.extractor = extractor
+        self.real_images = real_images
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.seed = seed
+        self.real_statistics = None
+        self.image_shape = tuple(extractor.input_shape[1:])
+
+    @tf.function
+    def features(self, images):
+        return self.extractor(adapt_images(images, self.image_shape), training=False)
+
+    def statistics(self, batches):
+        moments = StreamingMoments(self.extractor.output_shape[-1])
+        for images in batches:
+            moments.update(self.features(images).numpy())
+        return moments.mean, moments.covariance()
+
+    def real_batches(self):
+        # a fixed random subset, read in increasing index order
+        count = min(self.num_samples, len(self.real_images))
+        indexes = np.sort(np.random.default_rng(self.seed).choice(len(self.real_images), count, replace=False))
+        for start in range(0, count, self.batch_size):
+            yield normalize_images(np.asarray(self.real_images[indexes[start:start + self.batch_size]]))
+
+    def evaluate(self, generate):
+        # `generate(count)` returns a batch of generated images in [-1, 1]
+        if self.real_statistics is None:
+            self.real_statistics = self.statistics(self.real_batches())
+
+        sizes = [min(self.batch_size, self.num_samples - start) for start in range(0, self.num_samples, self.batch_size)]
+        fake_statistics = self.statistics(generate(size) for size in sizes)
+        return frechet_distance(*self.real_statistics, *fake_statistics)
+
+
+class FIDWriter:
+    # appends `step,fid` rows to `directory`/fid.csv
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'fid.csv')
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, 'a', newline='') as f:
+            if new:
+                csv.writer(f).writerow(['step', 'fid'])
+
+    def write(self, step, fid):
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerow([step, fid])
+
+    def truncate(self, step):
+        # drops the rows written after `step`, like MetricsWriter.truncate
+        with open(self.path, newline='') as f:
+            rows = list(csv.reader(f))
+        rows = rows[:1] + [row for row in rows[1:] if int(row[0]) <= step]
+
+        path = self.path + '.tmp'
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+        os.replace(path, self.path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trains and saves a feature extractor for the FID evaluation")
+    parser.add_argument('dataset', choices=sorted(FEATURE_DATASETS))
+    parser.add_argument('--feature-dir', default='/content/features/')
+    parser.add_argument('--epochs', type=int, default=5)
+    args = parser.parse_args()
+
+    load_feature_extractor(args.dataset, args.feature_dir, epochs=args.epochs)
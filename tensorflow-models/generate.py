@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from serve import Generator
+from shards import write_index
+
+# Generates samples from an exported generator (see GANTrainer.export_generator) into the
+# sharded layout of shards.py: shard-xxxxx.npy (or .tfrecord), labels.json and index.json.
+# Shards are written on a background thread while the next ones are generated; at most
+# one full shard waits for the writer, so memory does not grow with the sample count.
+
+
+class ShardWriter:
+    def __init__(self, output_dir, file_format='npy', queue_size=1):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.shards = []
+        self.error = None
+        self.queue = queue.Queue(queue_size)
+
+        # labels.json is streamed shard by shard instead of being held until the end
+        self.labels_file = open(os.path.join(output_dir, 'labels.json.tmp'), 'w')
+        self.labels_file.write('[')
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, images, labels):
+        # blocks while the writer is behind
+        if self.error is not None:
+            raise self.error
+        self.queue.put((images, labels))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is None:
+                try:
+                    self.write(*item)
+                except Exception as error:
+                    self.error = error
+
+    def write(self, images, labels):
+        name = 'shard-{:05d}.{}'.format(len(self.shards), self.file_format)
+        path = os.path.join(self.output_dir, name)
+        if self.file_format == 'npy':
+            np.save(path, images)
+        else:
+            write_tfrecord(path, images, labels)
+
+        separator = ',' if self.shards else ''
+        self.labels_file.write(separator + ','.join(json.dumps(label) for label in labels))
+        self.shards.append({'file': name, 'size': len(images)})
+
+    def close(self, image_shape, **extra):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+        self.labels_file.write(']')
+        self.labels_file.close()
+        os.replace(os.path.join(self.output_dir, 'labels.json.tmp'), os.path.join(self.output_dir, 'labels.json'))
+        write_index(self.output_dir, image_shape, self.shards, format=self.file_format, **extra)
+
+
+def write_tfrecord(path, images, labels):
+    # one tf.train.Example per image: raw uint8 bytes and the label as a string
+    with tf.io.TFRecordWriter(path) as writer:
+        for image, label in zip(images, labels):
+            feature = {
+                'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+                'label': tf.train.Feature(bytes_list=tf.train.BytesList(value=[str(label).encode()])),
+            }
+            writer.write(tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString())
+
+
+def batch_conditions(generator, start, count, texts=None, text_conditions=None):
+    # conditions and labels of samples start ... start + count; labels and texts are
+    # cycled through so every one gets the same share of the samples
+    indexes = np.arange(start, start + count)
+    if generator.conditioning == 'label':
+        labels = indexes % generator.metadata['num_labels']
+        return labels.reshape(-1, 1).astype(np.int32), labels.tolist()
+    if generator.conditioning == 'text':
+        indexes = indexes % len(texts)
+        return text_conditions[indexes], [texts[i] for i in indexes]
+    return None, [''] * count
+
+
+def generate_shards(generator, output_dir, count, batch_size=1024, shard_size=65536, seed=0, file_format='npy', texts=None):
+    image_shape = tuple(generator.model.output_shape[1:])
+    text_conditions = generator.text_conditions(texts) if generator.conditioning == 'text' else None
+    writer = ShardWriter(output_dir, file_format)
+
+    buffer = np.empty((min(shard_size, count),) + image_shape, dtype=np.uint8)
+    buffer_labels = []
+    start_time = time.time()
+
+    for batch, start in enumerate(range(0, count, batch_size)):
+        size = min(batch_size, count - start)
+        # every batch draws from its own stream, so a run is reproducible for a given seed
+        # and batch size
+        noise = np.random.default_rng([seed, batch]).standard_normal((size, generator.latent_dim), dtype=np.float32)
+        conditions, labels = batch_conditions(generator, start, size, texts, text_conditions)
+        images = generator(noise, conditions)
+
+        offset = 0
+        while offset < size:
+            filled = len(buffer_labels)
+            take = min(len(buffer) - filled, size - offset)
+            buffer[filled:filled + take] = images[offset:offset + take]
+            buffer_labels.extend(labels[offset:offset + take])
+            offset += take
+
+            if len(buffer_labels) == len(buffer):
+                writer.submit(buffer, buffer_labels)
+                done = start + offset
+                print("Generated {}/{} images ({:.0f} images/sec)".format(done, count, done / (time.time() - start_time)))
+                buffer = np.empty((min(shard_size, count - done),) + image_shape, dtype=np.uint8)
+                buffer_labels = []
+
+    writer.close(image_shape, generator=generator.metadata['model'], seed=seed, count=count)
+    print("Wrote {} shards to {}".format(len(writer.shards), output_dir))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates samples of an exported generator into shards")
+    parser.add_argument('export_dir', help="directory written by GANTrainer.export_generator")
+    parser.add_argument('output_dir')
+    parser.add_argument('--count', type=int, required=True)
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--shard-size', type=int, default=65536)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=['npy', 'tfrecord'], default='npy')
+    parser.add_argument('--texts', default=None, help="file of texts (one per line) for text-conditioned generators")
+    args = parser.parse_args()
+
+    generator = Generator(args.export_dir)
+    texts = None
+    if generator.conditioning == 'text':
+        if args.texts is None:
+            parser.error("{} is text conditioned, --texts is required".format(generator.metadata['model']))
+        with open(args.texts) as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    generate_shards(generator, args.output_dir, args.count, batch_size=args.batch_size, shard_size=args.shard_size,
+                    seed=args.seed, file_format=args.format, texts=texts)
@@ -0,0 +1,74 @@
+import os
+
+import tensorflow as tf
+import numpy as np
+
+from compositing import composite_on_white_tf
+
+AUTOTUNE = tf.data.experimental.AUTOTUNE
+
+
+def to_tensor(array):
+    # float64 arrays are converted to float32 once here instead of on every batch
+    if np.issubdtype(array.dtype, np.floating):
+        return tf.convert_to_tensor(array, dtype=tf.float32)
+    return tf.convert_to_tensor(array)
+
+
+def normalize_images(images):
+    # uint8 [0, 255] batch to float32 [-1, 1], adding the channel axis to grayscale
+    # (B, H, W) batches; RGBA (B, H, W, 4) batches are composited on white first
+    images = tf.convert_to_tensor(images)
+    if images.shape.rank == 4 and images.shape[-1] == 4:
+        images = composite_on_white_tf(images)
+    images = tf.cast(images, tf.float32) / 127.5 - 1.
+    if images.shape.rank == 3:
+        images = images[..., tf.newaxis]
+    return images
+
+
+def memmap_array(path, load):
+    # Returns the array stored at `path` memory mapped read-only, saving `load()` there
+    # first if the file does not exist yet.
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path + '.tmp.npy', load())
+        os.replace(path + '.tmp.npy', path)
+    return np.load(path, mmap_mode='r')
+
+
+def gather_function(array):
+    if isinstance(array, np.memmap) or not isinstance(array, np.ndarray):
+        # memory mapped arrays (and array-likes such as shards.ShardedImages) stay on
+        # disk, each batch is read through the page cache
+        def gather(indexes):
+            batch = tf.numpy_function(lambda indexes: np.asarray(array[indexes]), [indexes], tf.as_dtype(array.dtype))
+            batch.set_shape((None,) + array.shape[1:])
+            return batch
+        return gather
+
+    tensor = to_tensor(array)
+    return lambda indexes: tf.gather(tensor, indexes)
+
+
+def make_dataset(arrays, batch_size, seed=None, preprocess=None):
+    # `arrays` is a single array or a tuple of arrays sharing their first dimension
+    # (images, labels, sequences ...). The arrays are moved into tensors once and every
+    # batch is a gather over a shuffled index stream, so only the indices are shuffled.
+    # `preprocess` is applied in the graph to every batch, called with one argument per
+    # array (e.g. normalize_images for uint8 images).
+    gathers = tf.nest.map_structure(gather_function, arrays)
+    size = tf.nest.flatten(arrays)[0].shape[0]
+
+    def gather(indexes):
+        batch = tf.nest.map_structure(lambda gather: gather(indexes), gathers)
+        if preprocess is None:
+            return batch
+        return preprocess(*batch) if isinstance(batch, tuple) else preprocess(batch)
+
+    dataset = tf.data.Dataset.range(size)
+    dataset = dataset.shuffle(size, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.repeat()
+    dataset = dataset.batch(batch_size, drop_remainder=True)
+    dataset = dataset.map(gather, num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
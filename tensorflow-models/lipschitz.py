@@ -0,0 +1,105 @@
+import tensorflow as tf
+
+# ways of keeping the critic (approximately) 1-Lipschitz
+#   clip     - clip every kernel after each update (WGAN)
+#   gp       - penalise the critic's gradient norm on interpolated images (WGAN-GP)
+#   spectral - divide every kernel by its largest singular value (SN-GAN)
+# In spectral mode the critic uses LayerNormalization instead of BatchNormalization:
+# dividing by batch statistics rescales the activations by an amount the spectral norm
+# does not account for, and makes the critic of a sample depend on the rest of its batch.
+LIPSCHITZ_MODES = ('clip', 'gp', 'spectral')
+
+
+class ClipConstraint(tf.keras.constraints.Constraint):
+    def __init__(self, clip_value):
+      self.clip_value = clip_value
+
+    def __call__(self, weights):
+      return tf.clip_by_value(weights, -self.clip_value, self.clip_value)
+
+    def get_config(self):
+      return {'clip_value': self.clip_value}
+
+
+class SpectralNormalization(tf.keras.layers.Wrapper):
+    # Wraps a Conv2D or Dense layer and runs it with its kernel divided by the kernel's
+    # spectral norm. The norm is estimated by power iteration; the singular vector
+    # estimate `u` is kept in a non-trainable weight so one iteration per step is enough.
+    def __init__(self, layer, power_iterations=1, **kwargs):
+        if not isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.Dense)) or isinstance(layer, tf.keras.layers.Conv2DTranspose):
+            raise ValueError("SpectralNormalization supports Conv2D and Dense layers, got {}".format(type(layer).__name__))
+        # run with the wrapped layer's policy so float32 output layers stay float32
+        kwargs.setdefault('dtype', layer.dtype_policy)
+        super().__init__(layer, **kwargs)
+        self.power_iterations = power_iterations
+
+    def build(self, input_shape):
+        if not self.layer.built:
+            self.layer.build(input_shape)
+
+        units = self.layer.kernel.shape[-1]
+        self.u = self.add_weight(
+            name='sn_u',
+            shape=(1, units),
+            initializer=tf.keras.initializers.RandomNormal(),
+            trainable=False,
+            aggregation=tf.VariableAggregation.ONLY_FIRST_REPLICA)
+        super().build()
+
+    def normalized_kernel(self, training):
+        kernel = self.layer.kernel
+        w = tf.reshape(kernel, (-1, kernel.shape[-1]))
+
+        u = self.u
+        for _ in range(self.power_iterations):
+            v = tf.math.l2_normalize(tf.matmul(u, w, transpose_b=True))
+            u = tf.math.l2_normalize(tf.matmul(v, w))
+        u = tf.stop_gradient(u)
+        v = tf.stop_gradient(v)
+
+        if training:
+            self.u.assign(tf.cast(u, self.u.dtype))
+
+        sigma = tf.matmul(tf.matmul(v, w), u, transpose_b=True)
+        return kernel / sigma
+
+    def call(self, inputs, training=None):
+        kernel = self.normalized_kernel(training)
+
+        if isinstance(self.layer, tf.keras.layers.Conv2D):
+            outputs = self.layer.convolution_op(inputs, kernel)
+        else:
+            outputs = tf.tensordot(inputs, kernel, axes=1)
+
+        if self.layer.use_bias:
+            outputs = tf.nn.bias_add(outputs, self.layer.bias)
+        if self.layer.activation is not None:
+            outputs = self.layer.activation(outputs)
+        return outputs
+
+    def compute_output_shape(self, input_shape):
+        return self.layer.compute_output_shape(input_shape)
+
+    def get_config(self):
+        config = super().get_config()
+        config['power_iterations'] = self.power_iterations
+        return config
+
+
+def lipschitz_layer(layer, mode, clip_value=None):
+    if mode not in LIPSCHITZ_MODES:
+        raise ValueError("Unknown Lipschitz mode {}, expected one of {}".format(mode, LIPSCHITZ_MODES))
+
+    if mode == 'clip' and clip_value is not None:
+        # read by the layer when it creates its kernel
+        layer.kernel_constraint = ClipConstraint(clip_value)
+    elif mode == 'spectral':
+        layer = SpectralNormalization(layer)
+    return layer
+
+
+def critic_normalization(mode):
+    # normalization layer between the critic's convolutions
+    if mode == 'spectral':
+        return tf.keras.layers.LayerNormalization()
+    return tf.keras.layers.BatchNormalization()
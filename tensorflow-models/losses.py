@@ -0,0 +1,89 @@
+import tensorflow as tf
+
+
+def wasserstein_generator_loss(disc_fake_preds):
+    return -tf.reduce_mean(disc_fake_preds)
+
+
+def wasserstein_critic_loss(disc_fake_preds, disc_real_preds):
+    return tf.reduce_mean(disc_fake_preds) - tf.reduce_mean(disc_real_preds)
+
+
+def random_epsilons(images, batch_dims=1, rng=None):
+    # one epsilon per sample, broadcast over height, width and any number of channels
+    ones = tf.ones((images.shape.rank - batch_dims,), dtype=tf.int32)
+    shape = tf.concat([tf.shape(images)[:batch_dims], ones], axis=0)
+    if rng is not None:
+        return rng.uniform(shape, dtype=images.dtype)
+    return tf.random.uniform(shape, dtype=images.dtype)
+
+
+def gradient_penalty(gradients):
+    gradients = tf.cast(gradients, tf.float32)
+    # per-example gradient norm over every non-batch axis
+    axes = list(range(1, gradients.shape.rank))
+    norms = tf.sqrt(tf.reduce_sum(tf.square(gradients), axis=axes) + 1e-12)
+    return tf.reduce_mean(tf.square(norms - 1.))
+
+
+def gradient_penalty_critic_loss(discriminator, real_images, fake_images, epsilons, weight, training=True):
+    interpolated_images = epsilons * real_images + (1 - epsilons) * fake_images
+
+    with tf.GradientTape() as tape:
+        tape.watch(interpolated_images)
+        # real, fake and interpolated images go through the critic in a single forward pass
+        images = tf.concat([real_images, fake_images, interpolated_images], axis=0)
+        disc_real_preds, disc_fake_preds, disc_interpolated_preds = tf.split(discriminator(images, training=training), 3)
+
+    gradients = tape.gradient(disc_interpolated_preds, interpolated_images)
+
+    loss = wasserstein_critic_loss(disc_fake_preds, disc_real_preds)
+    return loss + weight * gradient_penalty(gradients)
+
+
+# Loss objects used by trainer.GANTrainer. `critic` is the discriminator with the
+# conditions of the batch (if any) already bound, called as critic(images, training=...).
+# discriminator_loss returns the loss and a tuple of extra metrics named by
+# `metric_names`.
+
+class MinimaxLoss:
+    # the non-saturating binary cross-entropy loss, for discriminators ending in a sigmoid
+    metric_names = ('discriminator_accuracy',)
+
+    def cross_entropy(self, labels, preds):
+        # reduced by hand: Keras loss objects refuse to reduce inside tf.distribute
+        return tf.reduce_mean(tf.keras.losses.binary_crossentropy(labels, preds))
+
+    def generator_loss(self, critic, fake_images):
+        disc_fake_preds = critic(fake_images)
+        return self.cross_entropy(tf.ones_like(disc_fake_preds), disc_fake_preds)
+
+    def discriminator_loss(self, critic, real_images, fake_images, epsilons):
+        disc_fake_preds = critic(fake_images)
+        disc_real_preds = critic(real_images)
+        disc_fake_loss = self.cross_entropy(tf.zeros_like(disc_fake_preds), disc_fake_preds)
+        disc_real_loss = self.cross_entropy(tf.ones_like(disc_real_preds), disc_real_preds)
+
+        correct = tf.concat([disc_fake_preds < 0.5, disc_real_preds >= 0.5], axis=0)
+        accuracy = tf.reduce_mean(tf.cast(correct, tf.float32))
+        return 0.5 * (disc_fake_loss + disc_real_loss), (accuracy,)
+
+
+class WassersteinLoss:
+    metric_names = ()
+
+    def generator_loss(self, critic, fake_images):
+        return wasserstein_generator_loss(critic(fake_images))
+
+    def discriminator_loss(self, critic, real_images, fake_images, epsilons):
+        disc_real_preds = critic(real_images)
+        disc_fake_preds = critic(fake_images)
+        return wasserstein_critic_loss(disc_fake_preds, disc_real_preds), ()
+
+
+class GradientPenaltyLoss(WassersteinLoss):
+    def __init__(self, weight):
+        self.weight = weight
+
+    def discriminator_loss(self, critic, real_images, fake_images, epsilons):
+        return gradient_penalty_critic_loss(critic, real_images, fake_images, epsilons, self.weight), ()
@@ -0,0 +1,106 @@
+import csv
+import os
+
+import numpy as np
+import tensorflow as tf
+
+STATISTICS = ('mean', 'min', 'max')
+
+
+class WindowMetrics:
+    # Running sum / count / min / max of a few scalar metrics over a logging window, kept
+    # in variables so train_step can update them without leaving the device. The host only
+    # reads them once per window.
+    def __init__(self, names):
+        self.names = tuple(names)
+        size = len(self.names)
+
+        self.total = tf.Variable(tf.zeros(size), trainable=False)
+        self.count = tf.Variable(0., trainable=False)
+        self.minimum = tf.Variable(tf.fill([size], np.inf), trainable=False)
+        self.maximum = tf.Variable(tf.fill([size], -np.inf), trainable=False)
+
+    def update(self, values):
+        # called from inside the tf.function, `values` are scalars in the order of `names`
+        values = tf.stack([tf.cast(value, tf.float32) for value in values])
+        self.total.assign_add(values)
+        self.count.assign_add(1.)
+        self.minimum.assign(tf.minimum(self.minimum, values))
+        self.maximum.assign(tf.maximum(self.maximum, values))
+
+    def result(self):
+        total, count, minimum, maximum = [variable.numpy() for variable in (self.total, self.count, self.minimum, self.maximum)]
+        mean = total / max(count, 1.)
+        return {name: {'mean': mean[i], 'min': minimum[i], 'max': maximum[i]} for i, name in enumerate(self.names)}
+
+    def reset(self):
+        size = len(self.names)
+        self.total.assign(tf.zeros(size))
+        self.count.assign(0.)
+        self.minimum.assign(tf.fill([size], np.inf))
+        self.maximum.assign(tf.fill([size], -np.inf))
+
+    def pop(self):
+        # result of the current window, then starts a new one
+        result = self.result()
+        self.reset()
+        return result
+
+
+class MetricsWriter:
+    # Appends one row per logging window to `metrics.csv` in `directory` and, optionally,
+    # the same values as TensorBoard scalars. The file is flushed after every row so it
+    # can be followed while training runs.
+    def __init__(self, directory, names, tensorboard=True):
+        os.makedirs(directory, exist_ok=True)
+        self.names = tuple(names)
+        self.path = os.path.join(directory, 'metrics.csv')
+        self.columns = ['step'] + ['{}_{}'.format(name, stat) for name in self.names for stat in STATISTICS]
+
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = open(self.path, 'a', newline='')
+        self.writer = csv.writer(self.file)
+        if new:
+            self.writer.writerow(self.columns)
+            self.file.flush()
+
+        self.summary_writer = tf.summary.create_file_writer(directory) if tensorboard else None
+
+    def write(self, step, result):
+        self.writer.writerow([step] + [result[name][stat] for name in self.names for stat in STATISTICS])
+        self.file.flush()
+
+        if self.summary_writer is not None:
+            with self.summary_writer.as_default():
+                for name in self.names:
+                    for stat in STATISTICS:
+                        tf.summary.scalar('{}/{}'.format(name, stat), result[name][stat], step=step)
+            self.summary_writer.flush()
+
+    def truncate(self, step):
+        # drops the rows written after `step`, used when resuming from a checkpoint that is
+        # older than the end of the file
+        self.file.close()
+        with open(self.path, newline='') as f:
+            rows = list(csv.reader(f))
+        rows = rows[:1] + [row for row in rows[1:] if int(row[0]) <= step]
+
+        path = self.path + '.tmp'
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+        os.replace(path, self.path)
+
+        self.file = open(self.path, 'a', newline='')
+        self.writer = csv.writer(self.file)
+
+    def read(self):
+        # the whole file as one float array per column
+        with open(self.path, newline='') as f:
+            rows = list(csv.reader(f))
+        values = np.array(rows[1:], dtype=np.float32).reshape(-1, len(rows[0]))
+        return {column: values[:, i] for i, column in enumerate(rows[0])}
+
+    def close(self):
+        self.file.close()
+        if self.summary_writer is not None:
+            self.summary_writer.close()
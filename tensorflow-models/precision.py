@@ -0,0 +1,41 @@
+import tensorflow as tf
+
+PRECISIONS = ('float32', 'mixed')
+
+
+def set_precision(precision):
+    # 'mixed' computes in bfloat16 on CPU (no loss scaling needed, same range as float32)
+    # and in float16 on GPU. Variables stay float32 either way, and the model outputs are
+    # kept in float32 by giving the last layers dtype='float32'.
+    if precision not in PRECISIONS:
+        raise ValueError("Unknown precision {}, expected one of {}".format(precision, PRECISIONS))
+
+    policy = 'float32'
+    if precision == 'mixed':
+        policy = 'mixed_float16' if tf.config.list_physical_devices('GPU') else 'mixed_bfloat16'
+
+    tf.keras.mixed_precision.set_global_policy(policy)
+    return policy
+
+
+def wrap_optimizer(optimizer):
+    # only float16 can underflow and needs the loss to be scaled
+    if tf.keras.mixed_precision.global_policy().name == 'mixed_float16':
+        return tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+    return optimizer
+
+
+def compute_gradients(tape, loss, variables, optimizer):
+    # The backward pass is seeded instead of rescaling the loss, so the loss does not have
+    # to be rescaled inside the tape:
+    #  - apply_gradients sums the gradients of all replicas, so every replica contributes
+    #    1 / num_replicas of its gradients
+    #  - with loss scaling the seed is multiplied by the loss scale, which is the same as
+    #    differentiating the scaled loss
+    seed = tf.cast(1. / tf.distribute.get_strategy().num_replicas_in_sync, loss.dtype)
+
+    if isinstance(optimizer, tf.keras.mixed_precision.LossScaleOptimizer):
+        seed = seed * tf.cast(optimizer.loss_scale, loss.dtype)
+        gradients = tape.gradient(loss, variables, output_gradients=seed)
+        return optimizer.get_unscaled_gradients(gradients)
+    return tape.gradient(loss, variables, output_gradients=seed)
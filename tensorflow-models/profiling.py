@@ -0,0 +1,109 @@
+import collections
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+PERCENTILES = (50, 90, 99)
+
+
+class NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+# shared by every disabled timer, so a disabled profiler costs one attribute lookup
+NULL_CONTEXT = NullContext()
+
+
+class Timer:
+    def __init__(self, durations):
+        self.durations = durations
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.durations.append(time.perf_counter() - self.start)
+        return False
+
+
+class StepProfiler:
+    # Named host-side timers and tf.profiler trace windows for the training loop.
+    #   with profiler.timer('sample'): ...     records the duration of the block
+    #   profiler.step(step)                    starts / stops the trace windows
+    #   profiler.write(step)                   percentiles of the window, appended to
+    #                                          `directory`/timings.jsonl
+    # Timers measure host time, so whatever they wrap has to wait for its outputs (see
+    # GANTrainer.profiled_step). `trace_steps` is a list of (start, stop) step ranges
+    # traced into `directory` for TensorBoard's profiler.
+    def __init__(self, directory, enabled=False, trace_steps=()):
+        self.directory = directory
+        self.enabled = enabled
+        self.trace_steps = [tuple(steps) for steps in trace_steps]
+        self.tracing = False
+        self.durations = collections.defaultdict(list)
+        self.file = None
+
+        if enabled or self.trace_steps:
+            os.makedirs(directory, exist_ok=True)
+        if enabled:
+            self.file = open(os.path.join(directory, 'timings.jsonl'), 'a')
+
+    def timer(self, name):
+        if not self.enabled:
+            return NULL_CONTEXT
+        return Timer(self.durations[name])
+
+    def step(self, step):
+        # called before every step
+        if not self.trace_steps:
+            return
+        in_window = any(start <= step < stop for start, stop in self.trace_steps)
+        if in_window and not self.tracing:
+            print("Profiling steps from {} into {}".format(step, self.directory))
+            tf.profiler.experimental.start(self.directory)
+            self.tracing = True
+        elif not in_window and self.tracing:
+            tf.profiler.experimental.stop()
+            self.tracing = False
+
+    def trace(self, step):
+        # marks the step in the trace viewer while a window is open
+        if not self.tracing:
+            return NULL_CONTEXT
+        return tf.profiler.experimental.Trace('train', step_num=step, _r=1)
+
+    def pop(self):
+        # percentiles (in milliseconds) of every timer since the last call
+        result = {}
+        for name, durations in self.durations.items():
+            if not durations:
+                continue
+            milliseconds = 1000 * np.asarray(durations)
+            result[name] = {'count': len(durations), 'mean_ms': float(milliseconds.mean())}
+            for percentile, value in zip(PERCENTILES, np.percentile(milliseconds, PERCENTILES)):
+                result[name]['p{}_ms'.format(percentile)] = float(value)
+            durations.clear()
+        return result
+
+    def write(self, step):
+        if not self.enabled:
+            return {}
+        result = self.pop()
+        self.file.write(json.dumps({'step': step, 'timings': result}) + '\n')
+        self.file.flush()
+        return result
+
+    def close(self):
+        if self.tracing:
+            tf.profiler.experimental.stop()
+            self.tracing = False
+        if self.file is not None:
+            self.file.close()
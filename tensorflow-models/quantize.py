@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from serve import Generator
+
+# Converts a generator exported by GANTrainer.export_generator for CPU inference:
+#   1. inference-mode BatchNormalization layers are folded into the neighbouring Dense /
+#      Conv2D / Conv2DTranspose layers
+#   2. the folded model is converted to TFLite as float32, with dynamic range
+#      quantization and with full int8 quantization calibrated on a representative
+#      latent set
+# Every variant is compared with the Keras model on a separate latent set (PSNR of the
+# images) and timed at batch size 1 and at a larger batch. The models and a report.json
+# are written to the output directory.
+LINEAR_LAYERS = (tf.keras.layers.Dense, tf.keras.layers.Conv2D, tf.keras.layers.Conv2DTranspose)
+VARIANTS = ('float32', 'dynamic', 'int8')
+
+
+def batch_norm_affine(layer):
+    # scale and shift of a BatchNormalization layer in inference mode
+    variance = layer.moving_variance.numpy()
+    scale = 1 / np.sqrt(variance + layer.epsilon)
+    if layer.gamma is not None:
+        scale = scale * layer.gamma.numpy()
+    shift = -layer.moving_mean.numpy() * scale
+    if layer.beta is not None:
+        shift = shift + layer.beta.numpy()
+    return scale, shift
+
+
+def normalizes_last_axis(layer):
+    return len(layer.axis) == 1 and layer.axis[0] == len(layer.input_shape) - 1
+
+
+def with_bias(layer):
+    # a copy of `layer` (unbuilt) that has a bias
+    config = layer.get_config()
+    config.pop('batch_input_shape', None)
+    config['use_bias'] = True
+    config['bias_initializer'] = 'zeros'
+    return layer.__class__.from_config(config)
+
+
+def fold_into_previous(layer, batch_norm):
+    # BN(x W + b) = x (W * scale) + (b * scale + shift), scaled along the output channels
+    scale, shift = batch_norm_affine(batch_norm)
+    kernel = layer.kernel.numpy()
+    bias = layer.bias.numpy() if layer.use_bias else np.zeros_like(shift)
+    if isinstance(layer, tf.keras.layers.Conv2DTranspose):
+        # (height, width, output channels, input channels)
+        kernel = kernel * scale[:, np.newaxis]
+    else:
+        kernel = kernel * scale
+    return with_bias(layer), [kernel, bias * scale + shift]
+
+
+def fold_into_next(batch_norm, layer):
+    # Dense(BN(x)) = x (scale[:, None] * W) + (shift W + b)
+    scale, shift = batch_norm_affine(batch_norm)
+    kernel = layer.kernel.numpy()
+    bias = layer.bias.numpy() if layer.use_bias else np.zeros(kernel.shape[1], dtype=kernel.dtype)
+    return with_bias(layer), [scale[:, np.newaxis] * kernel, shift @ kernel + bias]
+
+
+def fold_sequential(model):
+    # A copy of a Sequential model without the BatchNormalization layers that directly
+    # follow a Dense / Conv layer or directly precede a Dense layer. The other layers are
+    # shared with `model`.
+    layers, weights = [], {}
+    i = 0
+    while i < len(model.layers):
+        layer = model.layers[i]
+        following = model.layers[i + 1] if i + 1 < len(model.layers) else None
+        batch_norm = isinstance(following, tf.keras.layers.BatchNormalization) and normalizes_last_axis(following)
+
+        if isinstance(layer, LINEAR_LAYERS) and batch_norm:
+            folded, weights[len(layers)] = fold_into_previous(layer, following)
+            i += 2
+        elif (isinstance(layer, tf.keras.layers.BatchNormalization) and normalizes_last_axis(layer)
+              and isinstance(following, tf.keras.layers.Dense) and len(following.input_shape) == 2):
+            folded, weights[len(layers)] = fold_into_next(layer, following)
+            i += 2
+        else:
+            folded = layer
+            i += 1
+        layers.append(folded)
+
+    folded_model = tf.keras.Sequential([tf.keras.layers.InputLayer(input_shape=model.input_shape[1:])] + layers)
+    for index, layer_weights in weights.items():
+        folded_model.layers[index].set_weights(layer_weights)
+    print("\tFolded {} BatchNormalization layers of {}".format(len(weights), model.name))
+    return folded_model
+
+
+def fold_batch_norm(model):
+    if isinstance(model, tf.keras.Sequential):
+        return fold_sequential(model)
+    # functional generators (conditional models) wrap a Sequential image model, possibly
+    # inside further functional models; the other layers are shared
+    clone = lambda layer: fold_batch_norm(layer) if isinstance(layer, tf.keras.Model) else layer
+    return tf.keras.models.clone_model(model, clone_function=clone)
+
+
+def latent_inputs(generator, count, seed):
+    # noise and conditions shaped like the generator inputs
+    rng = np.random.default_rng(seed)
+    noise = rng.standard_normal((count, generator.latent_dim), dtype=np.float32)
+    if generator.conditioning == 'label':
+        return [noise, rng.integers(0, generator.metadata['num_labels'], (count, 1), dtype=np.int32)]
+    if generator.conditioning == 'text':
+        # one to four random vocabulary words, like the emoji names
+        words = list(generator.tokenizer.word_index)[1:generator.tokenizer.num_words]
+        texts = [" ".join(rng.choice(words, rng.integers(1, 5))) for _ in range(count)]
+        return [noise, generator.text_sequences(texts)]
+    return [noise]
+
+
+def convert(model, variant, representative_inputs=None):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if variant in ('dynamic', 'int8'):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == 'int8':
+        # the interface stays float32 / int32, every op inside runs in int8
+        converter.representative_dataset = lambda: ([tensor[i:i + 1] for tensor in representative_inputs]
+                                                    for i in range(len(representative_inputs[0])))
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+class TFLiteModel:
+    def __init__(self, model_content, threads=None):
+        self.interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=threads)
+        self.batch_size = None
+
+    def __call__(self, inputs):
+        # the noise is the only float input, so inputs are matched by dtype
+        details = self.interpreter.get_input_details()
+        by_dtype = {tensor.dtype: tensor for tensor in inputs}
+        if self.batch_size != len(inputs[0]):
+            for detail in details:
+                self.interpreter.resize_tensor_input(detail['index'], by_dtype[np.dtype(detail['dtype'])].shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(inputs[0])
+        for detail in details:
+            self.interpreter.set_tensor(detail['index'], by_dtype[np.dtype(detail['dtype'])])
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.interpreter.get_output_details()[0]['index'])
+
+
+def psnr(reference, images):
+    # on images mapped from [-1, 1] to [0, 1]
+    mse = np.mean(np.square((reference - images) / 2))
+    return float(10 * np.log10(1 / max(mse, 1e-12)))
+
+
+def timing(call, inputs, repeats):
+    call(inputs)
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        call(inputs)
+        durations.append(time.perf_counter() - start)
+    milliseconds = 1000 * np.asarray(durations)
+    return {
+        'p50_ms': float(np.percentile(milliseconds, 50)),
+        'p90_ms': float(np.percentile(milliseconds, 90)),
+        'images_per_second': float(len(inputs[0]) / np.median(durations)),
+    }
+
+
+def benchmark(call, generator, batch_size, repeats):
+    return {
+        'batch_1': timing(call, latent_inputs(generator, 1, seed=2), repeats),
+        'batch_{}'.format(batch_size): timing(call, latent_inputs(generator, batch_size, seed=3), max(repeats // 10, 3)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Folds, quantizes and benchmarks an exported generator with TFLite")
+    parser.add_argument('export_dir', help="directory written by GANTrainer.export_generator")
+    parser.add_argument('output_dir')
+    parser.add_argument('--representative-size', type=int, default=512)
+    parser.add_argument('--eval-size', type=int, default=256)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--min-psnr', type=float, default=25.,
+                        help="lowest PSNR (dB) against the Keras model a quantized variant may have")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    generator = Generator(args.export_dir)
+    model = generator.model
+    keras_call = tf.function(lambda inputs: model(inputs if len(inputs) > 1 else inputs[0], training=False))
+
+    print("Folding BatchNormalization...")
+    folded = fold_batch_norm(model)
+    eval_inputs = latent_inputs(generator, args.eval_size, seed=1)
+    reference = keras_call(eval_inputs).numpy()
+    folded_images = folded(eval_inputs if len(eval_inputs) > 1 else eval_inputs[0], training=False).numpy()
+    print("\tFolded model max abs difference : {:.2e}".format(np.abs(reference - folded_images).max()))
+
+    report = {
+        'model': generator.metadata['model'],
+        'keras': {'latency': benchmark(lambda inputs: keras_call(inputs).numpy(), generator, args.batch_size, args.repeats)},
+    }
+    representative_inputs = latent_inputs(generator, args.representative_size, seed=0)
+    failed = []
+
+    for variant in VARIANTS:
+        print("Converting {}...".format(variant))
+        content = convert(folded, variant, representative_inputs)
+        path = os.path.join(args.output_dir, 'generator_{}.tflite'.format(variant))
+        with open(path, 'wb') as f:
+            f.write(content)
+
+        tflite_model = TFLiteModel(content, args.threads)
+        images = np.concatenate([tflite_model([tensor[i:i + args.batch_size] for tensor in eval_inputs])
+                                 for i in range(0, args.eval_size, args.batch_size)])
+        result = {
+            'path': path,
+            'size_bytes': len(content),
+            'psnr': psnr(reference, images),
+            'max_abs_error': float(np.abs(reference - images).max()),
+            'latency': benchmark(tflite_model, generator, args.batch_size, args.repeats),
+        }
+        report[variant] = result
+        if variant != 'float32' and result['psnr'] < args.min_psnr:
+            failed.append(variant)
+
+        keras_latency = report['keras']['latency']['batch_1']['p50_ms']
+        print("\t{:.0f}KB | PSNR {:.1f}dB | batch 1 p50 {:.2f}ms ({:.2f}x Keras) | {:.0f} images/sec at batch {}".format(
+            len(content) / 1024, result['psnr'], result['latency']['batch_1']['p50_ms'],
+            keras_latency / result['latency']['batch_1']['p50_ms'],
+            result['latency']['batch_{}'.format(args.batch_size)]['images_per_second'], args.batch_size))
+
+    with open(os.path.join(args.output_dir, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for variant in failed:
+        print("{} is below {}dB PSNR against the Keras model".format(variant, args.min_psnr))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,80 @@
+import queue
+import threading
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+class SampleWriter:
+    # Renders grids of generated images to PNG files on a background thread. Frames are
+    # queued as NumPy arrays; when the renderer falls behind the oldest pending frame is
+    # dropped, so submit() never blocks the training loop.
+    def __init__(self, rows, cols, path_format, max_pending=2):
+        self.rows = rows
+        self.cols = cols
+        self.path_format = path_format
+        self.dropped = 0
+        self.failed = 0
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, epoch, images):
+        while True:
+            try:
+                self.queue.put_nowait((epoch, np.asarray(images)))
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.render(*item)
+            except Exception as error:
+                # e.g. a missing output directory; a failed frame must not stop the thread,
+                # close() waits for it
+                self.failed += 1
+                print("Could not write sample frame {} : {}".format(item[0], error))
+            finally:
+                self.queue.task_done()
+
+    def render(self, epoch, images):
+        # pyplot is not thread safe, so the figure is drawn through the Agg canvas directly
+        fig = Figure(figsize=(10, 10))
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(self.rows, self.cols, sharex=True, sharey=True, squeeze=False)
+
+        images = np.clip(images, 0., 1.)
+        count = 0
+
+        for i in range(self.rows):
+            for j in range(self.cols):
+                if images.shape[-1] == 1:
+                    axes[i, j].imshow(images[count, :, :, 0], cmap='gray')
+                else:
+                    axes[i, j].imshow(images[count])
+                axes[i, j].axis('off')
+                count += 1
+
+        fig.savefig(self.path_format.format(epoch), bbox_inches='tight')
+
+    def close(self):
+        # waits for the pending frames to be written
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.dropped:
+            print("Dropped {} sample frames".format(self.dropped))
+        if self.failed:
+            print("Failed to write {} sample frames".format(self.failed))
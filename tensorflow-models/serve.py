@@ -0,0 +1,263 @@
+import argparse
+import base64
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+from tensorflow.keras.preprocessing.text import tokenizer_from_json
+
+from text_conditioning import TextConditioning
+
+# Serves a generator exported by GANTrainer.export_generator over HTTP.
+#   POST /generate  {"count": 4, "seed": 7, "label": 3}   or  {"text": "smiling face"}
+#                   -> {"images": [base64 PNG, ...]}
+#   GET  /stats     batches and requests served so far (and text cache hits)
+# Concurrent requests are coalesced into one generator call by DynamicBatcher. The noise
+# of a request only depends on its seed, so batching never changes its images.
+
+
+class Generator:
+    def __init__(self, directory, cache_size=4096):
+        with open(os.path.join(directory, 'serving.json')) as f:
+            self.metadata = json.load(f)
+        self.model = tf.keras.models.load_model(os.path.join(directory, 'generator'), compile=False)
+        self.latent_dim = self.metadata['latent_dim']
+        self.conditioning = self.metadata['conditioning']
+        # the model requests run through; text generators exported with their conditioned
+        # generator take cached conditioning vectors instead of token ids
+        self.serving_model = self.model
+        self.text_conditioning = None
+
+        if self.conditioning == 'text':
+            self.tokenizer = tokenizer_from_json(self.metadata['tokenizer'])
+            condition_spec = tf.TensorSpec((None, self.metadata['max_len']), tf.int32)
+            if os.path.exists(os.path.join(directory, 'conditioned_generator')):
+                self.serving_model = tf.keras.models.load_model(os.path.join(directory, 'conditioned_generator'), compile=False)
+                embedding_matrix = np.load(os.path.join(directory, 'embedding.npy'))
+                self.text_conditioning = TextConditioning(self.tokenizer, embedding_matrix, self.metadata['max_len'], cache_size)
+                condition_spec = tf.TensorSpec((None, embedding_matrix.shape[1]), tf.float32)
+        else:
+            condition_spec = tf.TensorSpec((None, 1), tf.int32)
+
+        # a batch dimension of None, so batches of any size share one trace
+        noise_spec = tf.TensorSpec((None, self.latent_dim), tf.float32)
+        if self.conditioning is None:
+            self.generate = tf.function(self.generate_images, input_signature=[noise_spec])
+        else:
+            self.generate = tf.function(self.generate_images, input_signature=[noise_spec, condition_spec])
+
+    def generate_images(self, noise, conditions=None):
+        inputs = noise if conditions is None else [noise, conditions]
+        images = self.serving_model(inputs, training=False)
+        # [-1, 1] to uint8 on the device, only the bytes are copied back
+        return tf.cast(tf.clip_by_value(tf.round(127.5 * images + 127.5), 0, 255), tf.uint8)
+
+    def request_inputs(self, request):
+        # (noise, conditions) arrays of one request
+        count = int(request.get('count', 1))
+        seed = request.get('seed')
+        noise = np.random.default_rng(seed).standard_normal((count, self.latent_dim), dtype=np.float32)
+
+        if self.conditioning == 'label':
+            label = int(request['label'])
+            if not 0 <= label < self.metadata['num_labels']:
+                raise ValueError("label must be between 0 and {}".format(self.metadata['num_labels'] - 1))
+            return noise, np.full((count, 1), label, dtype=np.int32)
+        if self.conditioning == 'text':
+            if not isinstance(request['text'], str):
+                raise ValueError("text must be a string")
+            return noise, np.repeat(self.text_conditions([request['text']]), count, axis=0)
+        return noise, None
+
+    def text_conditions(self, texts):
+        # what the serving model takes for `texts`
+        if self.text_conditioning is not None:
+            return self.text_conditioning.vectors(texts)
+        return self.text_sequences(texts)
+
+    def text_sequences(self, texts):
+        # padded token ids of `texts`, tokenized like the training labels
+        sequences = self.tokenizer.texts_to_sequences(texts)
+        return pad_sequences(sequences, maxlen=self.metadata['max_len'], padding='post', truncating='post').astype(np.int32)
+
+    def stats(self):
+        if self.text_conditioning is None:
+            return {}
+        return {'text_cache': self.text_conditioning.stats()}
+
+    def __call__(self, noise, conditions):
+        if conditions is None:
+            return self.generate(noise).numpy()
+        return self.generate(noise, conditions).numpy()
+
+
+class DynamicBatcher:
+    # Collects requests on a queue and runs them through `generate` together. A batch is
+    # closed when it holds `max_batch_size` images or `max_latency` seconds after its first
+    # request arrived, whichever comes first. Requests larger than max_batch_size run alone.
+    def __init__(self, generate, max_batch_size=64, max_latency=0.01):
+        self.generate = generate
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.requests = 0
+        self.images = 0
+        # a request that did not fit the previous batch
+        self.pending = None
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, noise, conditions):
+        # returns a Future of the uint8 images of the request
+        future = Future()
+        self.queue.put((noise, conditions, future))
+        return future
+
+    def next_batch(self):
+        if self.pending is not None:
+            batch = [self.pending]
+            self.pending = None
+        else:
+            batch = [self.queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_latency
+
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if size + len(request[0]) > self.max_batch_size:
+                # does not fit, it starts the next batch
+                self.pending = request
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+
+            noise = np.concatenate([request[0] for request in batch])
+            conditions = None
+            if batch[0][1] is not None:
+                conditions = np.concatenate([request[1] for request in batch])
+
+            try:
+                images = self.generate(noise, conditions)
+            except Exception as error:
+                for _, _, future in batch:
+                    future.set_exception(error)
+                continue
+
+            offset = 0
+            for request_noise, _, future in batch:
+                future.set_result(images[offset:offset + len(request_noise)])
+                offset += len(request_noise)
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.images += len(noise)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'images': self.images,
+            'mean_batch_size': self.images / max(self.batches, 1),
+        }
+
+
+def encode_png(image):
+    if image.shape[-1] == 1:
+        image = image[..., 0]
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def make_handler(generator, batcher, max_count, timeout):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                stats = batcher.stats()
+                stats.update(generator.stats())
+                self.send_json(200, stats)
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/generate':
+                self.send_json(404, {'error': 'not found'})
+                return
+
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if not isinstance(request, dict):
+                    raise ValueError("request body must be a JSON object")
+                if not 1 <= int(request.get('count', 1)) <= max_count:
+                    raise ValueError("count must be between 1 and {}".format(max_count))
+                noise, conditions = generator.request_inputs(request)
+            except (ValueError, KeyError, TypeError) as error:
+                self.send_json(400, {'error': str(error)})
+                return
+
+            try:
+                images = batcher.submit(noise, conditions).result(timeout)
+            except Exception as error:
+                self.send_json(500, {'error': str(error) or type(error).__name__})
+                return
+            self.send_json(200, {'images': [encode_png(image) for image in images]})
+
+        def log_message(self, format, *args):
+            # one line per request would dominate the output under load
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves an exported generator over HTTP")
+    parser.add_argument('export_dir', help="directory written by GANTrainer.export_generator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-latency-ms', type=float, default=10.,
+                        help="how long the first request of a batch waits for others")
+    parser.add_argument('--max-count', type=int, default=256, help="images allowed per request")
+    parser.add_argument('--timeout', type=float, default=30.)
+    parser.add_argument('--text-cache-size', type=int, default=4096,
+                        help="prompts whose conditioning vectors are kept, for text generators")
+    args = parser.parse_args()
+
+    generator = Generator(args.export_dir, cache_size=args.text_cache_size)
+    # traces the generator before the first request arrives
+    generator(*generator.request_inputs({'count': 1, 'label': 0, 'text': ''}))
+
+    batcher = DynamicBatcher(generator, args.max_batch_size, args.max_latency_ms / 1000)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(generator, batcher, args.max_count, args.timeout))
+    print("Serving {} on http://{}:{}".format(generator.metadata['model'], args.host, args.port))
+    server.serve_forever()
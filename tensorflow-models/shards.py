@@ -0,0 +1,146 @@
+import argparse
+import csv
+import functools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from compositing import composite_on_white
+
+# A sharded dataset is a directory holding
+#   shard-00000.npy, shard-00001.npy ...  uint8 (n, H, W, C) image arrays
+#   labels.json                            one label per image, in shard order
+#   index.json                             format version, image shape and shard sizes
+# index.json is written last, so a directory without it is an incomplete conversion.
+# generate.py writes the same layout, optionally with TFRecord shards ('format' in
+# index.json), which ShardedImages does not read.
+FORMAT_VERSION = 1
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+
+def list_images(image_dir, labels_path=None):
+    # (paths, labels) from a `filename,label` CSV, or from the layout
+    # image_dir/<label>/<image> when no CSV is given
+    if labels_path is not None:
+        with open(labels_path, newline='') as f:
+            rows = [row for row in csv.reader(f) if row]
+        return [os.path.join(image_dir, row[0]) for row in rows], [row[1] for row in rows]
+
+    paths, labels = [], []
+    for root, dirs, files in os.walk(image_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(EXTENSIONS):
+                paths.append(os.path.join(root, name))
+                labels.append(os.path.relpath(root, image_dir).replace(os.sep, '/') if root != image_dir else '')
+    return paths, labels
+
+
+def decode_image(path, image_shape):
+    # runs in a worker process; transparent images are rendered on white, unless they
+    # are kept as RGBA (channels == 4) to be composited in the input pipeline
+    height, width, channels = image_shape
+    with Image.open(path) as image:
+        if channels == 3 and image.mode in ('RGBA', 'LA', 'P'):
+            image = Image.fromarray(composite_on_white(np.array(image.convert('RGBA'))[np.newaxis])[0])
+        image = image.convert({1: 'L', 3: 'RGB', 4: 'RGBA'}[channels])
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.BILINEAR)
+        return np.asarray(image).reshape(image_shape)
+
+
+def write_shards(paths, labels, output_dir, image_shape, shard_size=4096, workers=None):
+    # Decodes `paths` over a process pool and writes them as shards of `shard_size`
+    # images; only one shard is held in memory at a time.
+    os.makedirs(output_dir, exist_ok=True)
+    image_shape = tuple(image_shape)
+    decode = functools.partial(decode_image, image_shape=image_shape)
+    shards = []
+
+    with ProcessPoolExecutor(workers) as executor:
+        for start in range(0, len(paths), shard_size):
+            chunk = paths[start:start + shard_size]
+            images = np.empty((len(chunk),) + image_shape, dtype=np.uint8)
+            for i, image in enumerate(executor.map(decode, chunk, chunksize=32)):
+                images[i] = image
+
+            name = 'shard-{:05d}.npy'.format(len(shards))
+            np.save(os.path.join(output_dir, name), images)
+            shards.append({'file': name, 'size': len(chunk)})
+            print("Wrote {} ({}/{} images)".format(name, start + len(chunk), len(paths)))
+
+    with open(os.path.join(output_dir, 'labels.json'), 'w') as f:
+        json.dump(labels, f)
+
+    write_index(output_dir, image_shape, shards)
+
+
+def write_index(output_dir, image_shape, shards, **extra):
+    # the last file of a conversion, `extra` keys are stored alongside (e.g. provenance)
+    index = {'version': FORMAT_VERSION, 'format': 'npy', 'image_shape': list(image_shape), 'dtype': 'uint8', 'shards': shards}
+    index.update(extra)
+    with open(os.path.join(output_dir, 'index.json.tmp'), 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(os.path.join(output_dir, 'index.json.tmp'), os.path.join(output_dir, 'index.json'))
+
+
+class ShardedImages:
+    # Read-only view over a sharded dataset that behaves like a uint8 (N, H, W, C) array
+    # for fancy indexing: every shard is memory mapped, so only the pages of the images
+    # that are actually read are loaded. make_dataset gathers its batches through
+    # tf.numpy_function like it does for np.memmap arrays.
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'index.json')) as f:
+            index = json.load(f)
+        if index['version'] != FORMAT_VERSION:
+            raise ValueError("Unsupported shard format version {} in {}".format(index['version'], directory))
+        if index.get('format', 'npy') != 'npy':
+            raise ValueError("{} holds {} shards, only npy shards can be memory mapped".format(directory, index['format']))
+
+        self.shards = [np.load(os.path.join(directory, shard['file']), mmap_mode='r') for shard in index['shards']]
+        self.offsets = np.cumsum([0] + [shard['size'] for shard in index['shards']])
+        self.dtype = np.dtype(index['dtype'])
+        self.shape = (int(self.offsets[-1]),) + tuple(index['image_shape'])
+
+        with open(os.path.join(directory, 'labels.json')) as f:
+            self.labels = json.load(f)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, indexes):
+        # reads each shard in increasing index order, then puts the images back in the
+        # requested order
+        indexes = np.asarray(indexes, dtype=np.int64)
+        order = np.argsort(indexes, kind='stable')
+        sorted_indexes = indexes[order]
+        shard_ids = np.searchsorted(self.offsets, sorted_indexes, side='right') - 1
+
+        images = np.empty((len(indexes),) + self.shape[1:], dtype=self.dtype)
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            images[order[mask]] = self.shards[shard_id][sorted_indexes[mask] - self.offsets[shard_id]]
+        return images
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converts an image directory into memory mapped uint8 shards")
+    parser.add_argument('image_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--labels', default=None,
+                        help="CSV of filename,label rows, otherwise the sub directory of each image is its label")
+    parser.add_argument('--height', type=int, default=64)
+    parser.add_argument('--width', type=int, default=64)
+    parser.add_argument('--channels', type=int, choices=[1, 3, 4], default=3,
+                        help="4 keeps the alpha channel, batches are then composited on white in the input pipeline")
+    parser.add_argument('--shard-size', type=int, default=4096)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    paths, labels = list_images(args.image_dir, args.labels)
+    print("Found {} images".format(len(paths)))
+    write_shards(paths, labels, args.output_dir, (args.height, args.width, args.channels),
+                 shard_size=args.shard_size, workers=args.workers)
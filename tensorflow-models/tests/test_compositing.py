@@ -0,0 +1,54 @@
+import numpy as np
+
+from compositing import composite_on_white, composite_on_white_tf
+from input_pipeline import normalize_images
+
+
+def reference(images):
+    # float64 is exact enough here: a non-integer result is at least 1/255 away from the
+    # next integer
+    rgb, alpha = images[..., :3].astype(np.float64), images[..., 3:].astype(np.float64)
+    return np.floor(255 - (255 - rgb) * alpha / 255).astype(np.uint8)
+
+
+def all_pairs():
+    # every (rgb, alpha) pair, one image row per alpha value
+    rgb, alpha = np.meshgrid(np.arange(256), np.arange(256))
+    images = np.stack([rgb, rgb, rgb, alpha], axis=-1).astype(np.uint8)
+    return images.reshape(4, 64, 256, 4)
+
+
+def test_matches_reference_for_every_pair():
+    images = all_pairs()
+    expected = reference(images)
+    np.testing.assert_array_equal(composite_on_white(images.copy(), chunk_size=3), expected)
+
+
+def test_known_pairs():
+    images = np.array([[[[0, 0, 0, 65], [10, 20, 30, 0], [10, 20, 30, 255]]]], dtype=np.uint8)
+    result = composite_on_white(images)
+    np.testing.assert_array_equal(result[0, 0], [[190, 190, 190], [255, 255, 255], [10, 20, 30]])
+
+
+def test_out_argument_leaves_input_untouched():
+    images = np.random.default_rng(0).integers(0, 256, (5, 4, 4, 4), dtype=np.uint8)
+    original = images.copy()
+    out = np.empty((5, 4, 4, 3), dtype=np.uint8)
+
+    result = composite_on_white(images, out=out, chunk_size=2)
+    assert result is out
+    np.testing.assert_array_equal(images, original)
+    np.testing.assert_array_equal(out, reference(original))
+
+
+def test_tf_variant_matches_numpy():
+    images = all_pairs()
+    result = composite_on_white_tf(images).numpy()
+    assert result.dtype == np.uint8
+    np.testing.assert_array_equal(result, composite_on_white(images.copy()))
+
+
+def test_normalize_images_composites_rgba():
+    images = all_pairs()[:1]
+    expected = composite_on_white(images.copy()).astype(np.float32) / 127.5 - 1.
+    np.testing.assert_allclose(normalize_images(images).numpy(), expected, atol=1e-6)
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from conditional_sampling import LabelRequestQueue, generate_per_label
+
+IMAGE_SHAPE = (2, 2, 1)
+
+
+class StubGenerator:
+    # images filled with their label, so every request can check it got its own images
+    def __init__(self):
+        self.batch_sizes = []
+        self.fail = False
+
+    def __call__(self, noise, labels):
+        if self.fail:
+            raise RuntimeError("generator failed")
+        self.batch_sizes.append(len(noise))
+        return np.broadcast_to(labels.reshape(-1, 1, 1, 1), (len(labels),) + IMAGE_SHAPE).astype(np.uint8)
+
+
+def test_requests_get_their_own_images():
+    generate = StubGenerator()
+    queue = LabelRequestQueue(generate, latent_dim=4, batch_size=8, seed=0)
+    counts = [(3, 5), (7, 2), (1, 10), (3, 1)]
+    requests = [queue.submit(label, count) for label, count in counts]
+    queue.flush()
+
+    for (label, count), request in zip(counts, requests):
+        images = request.result()
+        assert images.shape == (count,) + IMAGE_SHAPE
+        assert (images == label).all()
+    assert generate.batch_sizes == [8, 8, 2]
+
+
+def test_result_before_flush_raises():
+    queue = LabelRequestQueue(StubGenerator(), latent_dim=4, batch_size=8)
+    request = queue.submit(1, 3)
+    with pytest.raises(RuntimeError):
+        request.result()
+
+
+def test_empty_request():
+    generate = StubGenerator()
+    queue = LabelRequestQueue(generate, latent_dim=4, batch_size=8)
+    request = queue.submit(2, 0)
+    queue.flush()
+    images = request.result()
+    assert images.shape == (0,) + IMAGE_SHAPE
+    assert images.dtype == np.uint8
+
+
+def test_empty_request_with_image_shape_does_not_generate():
+    generate = StubGenerator()
+    queue = LabelRequestQueue(generate, latent_dim=4, batch_size=8, image_shape=IMAGE_SHAPE)
+    assert queue.submit(2, 0).result().shape == (0,) + IMAGE_SHAPE
+    assert generate.batch_sizes == []
+
+
+def test_negative_count_raises():
+    queue = LabelRequestQueue(StubGenerator(), latent_dim=4)
+    with pytest.raises(ValueError):
+        queue.submit(0, -1)
+
+
+def test_out_of_range_label_raises():
+    queue = LabelRequestQueue(StubGenerator(), latent_dim=4, num_labels=10)
+    with pytest.raises(ValueError):
+        queue.submit(10, 1)
+    with pytest.raises(ValueError):
+        queue.submit(-1, 1)
+    assert queue.pending_count == 0
+
+
+def test_requests_stay_queued_when_generate_fails():
+    generate = StubGenerator()
+    queue = LabelRequestQueue(generate, latent_dim=4, batch_size=8)
+    requests = [queue.submit(4, 3), queue.submit(5, 3)]
+
+    generate.fail = True
+    with pytest.raises(RuntimeError):
+        queue.flush()
+    assert queue.pending_count == 6
+    assert all(request.remaining == 3 for request in requests)
+
+    generate.fail = False
+    queue.flush()
+    assert (requests[0].result() == 4).all() and (requests[1].result() == 5).all()
+    assert queue.pending_count == 0
+
+
+def test_generate_per_label():
+    images = generate_per_label(StubGenerator(), latent_dim=4, num_labels=3, count=2, seed=0)
+    assert images.shape == (3, 2) + IMAGE_SHAPE
+    for label in range(3):
+        assert (images[label] == label).all()
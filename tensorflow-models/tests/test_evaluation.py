@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from evaluation import FIDWriter, StreamingMoments, frechet_distance
+
+
+def test_streaming_moments_match_numpy():
+    rng = np.random.default_rng(0)
+    features = rng.normal(size=(1000, 8)) * rng.uniform(0.5, 3, 8) + rng.normal(size=8)
+
+    moments = StreamingMoments(8)
+    for start, size in [(0, 1), (1, 300), (301, 0), (301, 499), (800, 200)]:
+        moments.update(features[start:start + size])
+
+    assert moments.count == 1000
+    np.testing.assert_allclose(moments.mean, features.mean(axis=0))
+    np.testing.assert_allclose(moments.covariance(), np.cov(features, rowvar=False))
+
+
+def test_frechet_distance_matches_sqrtm():
+    linalg = pytest.importorskip('scipy.linalg')
+    rng = np.random.default_rng(1)
+    a, b = rng.normal(size=(500, 6)), 1.5 * rng.normal(size=(500, 6)) + 0.3
+    mean1, covariance1 = a.mean(axis=0), np.cov(a, rowvar=False)
+    mean2, covariance2 = b.mean(axis=0), np.cov(b, rowvar=False)
+
+    root = linalg.sqrtm(covariance1 @ covariance2).real
+    expected = np.sum(np.square(mean1 - mean2)) + np.trace(covariance1 + covariance2 - 2 * root)
+    np.testing.assert_allclose(frechet_distance(mean1, covariance1, mean2, covariance2), expected, rtol=1e-6)
+
+
+def test_frechet_distance_of_identical_statistics_is_zero():
+    covariance = np.cov(np.random.default_rng(2).normal(size=(100, 4)), rowvar=False)
+    assert abs(frechet_distance(np.ones(4), covariance, np.ones(4), covariance)) < 1e-8
+
+
+def test_fid_writer_truncate(tmp_path):
+    writer = FIDWriter(str(tmp_path))
+    for step in (1000, 2000, 3000):
+        writer.write(step, step / 1000)
+    writer.truncate(2000)
+    writer.write(3000, 0.5)
+
+    with open(writer.path) as f:
+        assert f.read().splitlines() == ['step,fid', '1000,1.0', '2000,2.0', '3000,0.5']
@@ -0,0 +1,29 @@
+import threading
+
+import numpy as np
+
+from sample_writer import SampleWriter
+
+
+class FailingWriter(SampleWriter):
+    def render(self, epoch, images):
+        raise OSError("No such file or directory: '/content/image_at_{}.png'".format(epoch))
+
+
+def test_close_returns_after_render_fails():
+    writer = FailingWriter(1, 1, "/nonexistent/image_at_{}.png")
+    for epoch in range(5):
+        writer.submit(epoch, np.zeros((1, 2, 2, 1)))
+
+    closer = threading.Thread(target=writer.close, daemon=True)
+    closer.start()
+    closer.join(timeout=10)
+    assert not closer.is_alive()
+    assert writer.failed + writer.dropped == 5
+
+
+def test_writes_frames(tmp_path):
+    writer = SampleWriter(1, 2, str(tmp_path / "image_at_{}.png"))
+    writer.submit(3, np.zeros((2, 4, 4, 3)))
+    writer.close()
+    assert (tmp_path / "image_at_3.png").exists()
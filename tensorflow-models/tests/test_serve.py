@@ -0,0 +1,57 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from serve import Generator, make_handler
+
+
+def text_generator():
+    # request_inputs only needs the metadata, the model is never called
+    generator = Generator.__new__(Generator)
+    generator.metadata = {'model': 'EmotiGAN', 'max_len': 20}
+    generator.latent_dim = 4
+    generator.conditioning = 'text'
+    generator.text_conditioning = None
+    return generator
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(text_generator(), None, max_count=8, timeout=1))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}/generate'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as error:
+        return error.code, json.load(error)
+
+
+@pytest.mark.parametrize('body', [[1, 2], "text", 3, None])
+def test_body_that_is_not_an_object_is_rejected(server, body):
+    status, response = post(server, body)
+    assert status == 400
+    assert 'JSON object' in response['error']
+
+
+@pytest.mark.parametrize('text', [3, None, True, ['smiling', 'face']])
+def test_text_that_is_not_a_string_is_rejected(server, text):
+    status, response = post(server, {'text': text})
+    assert status == 400
+    assert 'string' in response['error']
+
+
+def test_missing_text_is_rejected(server):
+    status, _ = post(server, {'count': 1})
+    assert status == 400
@@ -0,0 +1,34 @@
+import functools
+
+import numpy as np
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+
+class TextConditioning:
+    # Turns EmotiGAN prompts into the conditioning vectors of EmotiGAN.conditioned_generator:
+    # the sum of the frozen word2vec rows of the padded token ids, like the Embedding +
+    # reduce_sum layers in front of the text generator. Vectors are memoized per prompt in
+    # an LRU cache of `cache_size` entries, so repeated prompts skip the tokenizer too.
+    def __init__(self, tokenizer, embedding_matrix, max_len, cache_size=4096):
+        self.tokenizer = tokenizer
+        self.embedding_matrix = np.asarray(embedding_matrix, dtype=np.float32)
+        self.max_len = max_len
+        self.vector = functools.lru_cache(maxsize=cache_size)(self.compute_vector)
+
+    def sequences(self, texts):
+        sequences = self.tokenizer.texts_to_sequences(texts)
+        return pad_sequences(sequences, maxlen=self.max_len, padding='post', truncating='post')
+
+    def compute_vector(self, text):
+        # padding ids (0) are summed as well, the embedding model does not mask them
+        vector = self.embedding_matrix[self.sequences([text])[0]].sum(axis=0)
+        # shared by every hit of the cache
+        vector.flags.writeable = False
+        return vector
+
+    def vectors(self, texts):
+        return np.stack([self.vector(text) for text in texts])
+
+    def stats(self):
+        info = self.vector.cache_info()
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
@@ -0,0 +1,421 @@
+import json
+import os
+import time
+
+import matplotlib.pyplot as plt
+import tensorflow as tf
+
+from checkpoint import AsyncCheckpointManager
+from distribute import get_strategy, reduce_mean
+from evaluation import Evaluator, FIDWriter, load_feature_extractor
+from input_pipeline import make_dataset, normalize_images
+from losses import random_epsilons
+from metrics import MetricsWriter, WindowMetrics
+from precision import compute_gradients, set_precision, wrap_optimizer
+from profiling import StepProfiler
+from sample_writer import SampleWriter
+
+
+def block(outputs):
+    # pulling the outputs (including per-replica values) to the host waits for them
+    return [tensor.numpy() for tensor in tf.nest.flatten(outputs, expand_composites=True)]
+
+
+class TrainerConfig:
+    # Defaults of the options GANTrainer reads. A model's config subclasses it and sets
+    # its own hyperparameters, output directories and whatever else differs.
+    #
+    # discriminator updates per generator update
+    CRITIC_SIZE = 1
+    # 'float32' or 'mixed'
+    PRECISION = 'float32'
+    # None for a single replica or 'mirrored' for data parallel training, optionally
+    # over CPU_REPLICAS logical CPU devices; BATCH_SIZE is the global batch size
+    STRATEGY = None
+    CPU_REPLICAS = None
+    # compile the forward and backward passes with XLA
+    JIT_COMPILE = False
+
+    CHECKPOINT_DIR = '/content/checkpoints/'
+    # a checkpoint is written every CHECKPOINT_STEPS steps or CHECKPOINT_SECONDS seconds
+    CHECKPOINT_STEPS = 1000
+    CHECKPOINT_SECONDS = 600
+    # losses are averaged on device over LOG_INTERVAL steps and appended to
+    # METRICS_DIR/metrics.csv (and TensorBoard) once per interval
+    LOG_INTERVAL = 500
+    METRICS_DIR = '/content/metrics/'
+    TENSORBOARD = True
+    SAMPLE_INTERVAL = 1000
+
+    # uint8 images are memory mapped from MMAP_DIR (written there on the first run)
+    # instead of being held in memory, None to load them into memory
+    MMAP_DIR = None
+    # a directory written by shards.py to train on instead of the built-in dataset; the
+    # shards are memory mapped, so the dataset can be larger than RAM
+    SHARDS_DIR = None
+
+    # times every phase of a step (slower, the phases run separately) and writes their
+    # percentiles to PROFILE_DIR/timings.jsonl every LOG_INTERVAL steps
+    PROFILE = False
+    # (start, stop) step ranges traced with tf.profiler into PROFILE_DIR
+    PROFILE_TRACE_STEPS = ()
+    PROFILE_DIR = '/content/profile/'
+    # the trained generator is exported here for serve.py, None to skip the export
+    EXPORT_DIR = None
+    # FID against FID_SAMPLES training images every FID_INTERVAL steps (None to skip),
+    # with a feature extractor trained on FID_DATASET and kept in FEATURE_DIR
+    FID_INTERVAL = None
+    FID_SAMPLES = 10000
+    FID_DATASET = 'mnist'
+    FEATURE_DIR = '/content/features/'
+
+
+class GANTrainer:
+    # Training engine shared by every model. A model subclasses it and supplies
+    #   load_data()                               uint8 images, or (images, conditions)
+    #   build_generator() / build_discriminator()
+    #   build_optimizer()                         called once per network
+    #   build_loss()                              a loss object from losses.py
+    # plus sample_inputs() when the generator takes more than noise. Conditional models
+    # take [noise, conditions] / [images, conditions] as generator / discriminator inputs.
+    #
+    # Every step runs config.CRITIC_SIZE discriminator updates followed by one generator
+    # update. With config.JIT_COMPILE the forward and backward passes are compiled with
+    # XLA; the optimizer updates stay outside since they all-reduce across replicas. If
+    # XLA cannot compile the model the step falls back to graph mode on its first call.
+    #
+    # With config.PROFILE the phases of a step (data, every critic update, generator
+    # update) run as separate functions under host timers, next to timers around
+    # sampling, logging and checkpointing; percentiles are written every LOG_INTERVAL.
+    #
+    # With config.FID_INTERVAL the Frechet distance between features of FID_SAMPLES real
+    # and generated images (see evaluation.py) is appended to METRICS_DIR/fid.csv.
+    SAMPLE_GRID = (4, 4)
+    SAMPLE_PATH = "/content/image_at_{}.png"
+    # runs the discriminator in inference mode (moving batch norm statistics, no dropout)
+    # while the generator is updated
+    FREEZE_DISCRIMINATOR = False
+    # runs the generator in inference mode while the discriminator is updated, so its batch
+    # norm statistics only move with the batches it is trained on
+    FREEZE_GENERATOR = False
+
+    def __init__(self, config):
+        self.config = config
+        set_precision(config.PRECISION)
+        self.strategy = get_strategy(config.STRATEGY, config.CPU_REPLICAS)
+
+        print("Loading Data...")
+        # kept as uint8, batches are normalized in the input pipeline
+        self.train_data = self.load_data()
+        print("Data Shape : ", tf.nest.flatten(self.train_data)[0].shape)
+        print()
+
+        # every element holds the real batches for a whole critic phase
+        dataset = make_dataset(self.train_data, config.CRITIC_SIZE * config.BATCH_SIZE, preprocess=self.preprocess)
+        self.dataset = self.strategy.experimental_distribute_dataset(dataset)
+        self.iterator = iter(self.dataset)
+
+        with self.strategy.scope():
+            # one optimizer per network, so each keeps its own slots and iteration count
+            # (Adam's bias correction would otherwise advance CRITIC_SIZE + 1 times a step)
+            self.discriminator_optimizer = wrap_optimizer(self.build_optimizer())
+            self.generator_optimizer = wrap_optimizer(self.build_optimizer())
+            self.rng = tf.random.Generator.from_non_deterministic_state()
+            self.step = tf.Variable(0, trainable=False, dtype=tf.int64)
+            self.critic_size = tf.Variable(config.CRITIC_SIZE, trainable=False, dtype=tf.int32)
+            self.generator, self.discriminator = self.build_models()
+
+        self.loss = self.build_loss()
+        self.build_step(config.JIT_COMPILE)
+
+        self.metrics = WindowMetrics(('generator_loss', 'discriminator_loss') + self.loss.metric_names)
+        self.metrics_writer = MetricsWriter(config.METRICS_DIR, self.metrics.names, tensorboard=config.TENSORBOARD)
+
+        self.checkpoint = AsyncCheckpointManager(
+            config.CHECKPOINT_DIR, every_steps=config.CHECKPOINT_STEPS, every_seconds=config.CHECKPOINT_SECONDS,
+            generator=self.generator, discriminator=self.discriminator,
+            generator_optimizer=self.generator_optimizer, discriminator_optimizer=self.discriminator_optimizer,
+            rng=self.rng, step=self.step)
+
+        self.sample_writer = SampleWriter(*self.SAMPLE_GRID, self.SAMPLE_PATH)
+        self.profiler = StepProfiler(config.PROFILE_DIR, enabled=config.PROFILE, trace_steps=config.PROFILE_TRACE_STEPS)
+
+        self.evaluator = None
+        if config.FID_INTERVAL is not None:
+            extractor = load_feature_extractor(config.FID_DATASET, config.FEATURE_DIR)
+            self.evaluator = Evaluator(extractor, tf.nest.flatten(self.train_data)[0], num_samples=config.FID_SAMPLES)
+            self.fid_writer = FIDWriter(config.METRICS_DIR)
+
+    def build_step(self, jit_compile):
+        self.jit_compile = jit_compile
+        self.critic_gradients_fn = tf.function(self.critic_gradients, jit_compile=jit_compile)
+        self.generator_gradients_fn = tf.function(self.generator_gradients, jit_compile=jit_compile)
+        self.step_fn = tf.function(self.distributed_step)
+        # the phases of distributed_step on their own, for profiled_step and benchmarks
+        strategy = self.strategy
+        self.data_fn = tf.function(lambda iterator: strategy.run(self.critic_inputs, args=(next(iterator),)))
+        self.critic_fn = tf.function(lambda i, inputs: reduce_mean(strategy, strategy.run(self.critic_step, args=(i,) + inputs)))
+        self.generator_fn = tf.function(lambda inputs: reduce_mean(strategy, strategy.run(self.generator_step, args=inputs)))
+        # seconds spent tracing and compiling the first step, None until it has run
+        self.compile_time = None
+
+    def build_models(self):
+        print("Building Generator...")
+        generator = self.build_generator()
+
+        print("Building Discriminator...")
+        discriminator = self.build_discriminator()
+        return generator, discriminator
+
+    def preprocess(self, images, *conditions):
+        images = normalize_images(images)
+        return (images,) + conditions if conditions else images
+
+    def generator_inputs(self, noise, conditions=None):
+        return noise if conditions is None else [noise, conditions]
+
+    def critic(self, conditions=None, training=True):
+        # the discriminator with the conditions bound; they are repeated when several
+        # batches are stacked (e.g. the single forward pass of the gradient penalty)
+        def call(images, training=training):
+            if conditions is None:
+                return self.discriminator(images, training=training)
+            repeats = tf.shape(images)[0] // tf.shape(conditions)[0]
+            multiples = [repeats] + [1] * (conditions.shape.rank - 1)
+            return self.discriminator([images, tf.tile(conditions, multiples)], training=training)
+        return call
+
+    def set_critic_size(self, critic_size):
+        # changing the critic count only updates a variable, so train_step is not retraced
+        if not 1 <= critic_size <= self.config.CRITIC_SIZE:
+            raise ValueError("critic_size must be between 1 and {}, got {}".format(self.config.CRITIC_SIZE, critic_size))
+        self.critic_size.assign(critic_size)
+
+    def critic_inputs(self, batch):
+        # splitting the element into the batches of every critic update and drawing their
+        # noise and epsilons at once
+        batch = batch if isinstance(batch, tuple) else (batch,)
+        batch = tuple(tf.reshape(tensor, (self.config.CRITIC_SIZE, -1) + tuple(tensor.shape[1:])) for tensor in batch)
+        noise = self.rng.normal((self.config.CRITIC_SIZE, tf.shape(batch[0])[1], self.config.LATENT_DIM))
+        epsilons = random_epsilons(batch[0], batch_dims=2, rng=self.rng)
+        return (noise, epsilons) + batch
+
+    def critic_gradients(self, noise, epsilons, real_images, conditions):
+        fake_images = self.generator(self.generator_inputs(noise, conditions), training=not self.FREEZE_GENERATOR)
+
+        with tf.GradientTape() as tape:
+            loss, metrics = self.loss.discriminator_loss(self.critic(conditions), real_images, fake_images, epsilons)
+
+        gradients = compute_gradients(tape, loss, self.discriminator.trainable_variables, self.discriminator_optimizer)
+        return gradients, loss, metrics
+
+    def critic_step(self, i, noise, epsilons, real_images, *conditions):
+        conditions = conditions[0][i] if conditions else None
+        gradients, loss, metrics = self.critic_gradients_fn(noise[i], epsilons[i], real_images[i], conditions)
+        self.discriminator_optimizer.apply_gradients(zip(gradients, self.discriminator.trainable_variables))
+        return (loss,) + tuple(metrics)
+
+    def generator_gradients(self, noise, conditions):
+        critic = self.critic(conditions, training=not self.FREEZE_DISCRIMINATOR)
+
+        with tf.GradientTape() as tape:
+            fake_images = self.generator(self.generator_inputs(noise, conditions), training=True)
+            loss = self.loss.generator_loss(critic, fake_images)
+
+        gradients = compute_gradients(tape, loss, self.generator.trainable_variables, self.generator_optimizer)
+        return gradients, loss
+
+    def generator_step(self, noise, epsilons, real_images, *conditions):
+        # BATCH_SIZE is the global batch, every replica generates its share of it;
+        # conditional models reuse the conditions of the first critic batch
+        conditions = conditions[0][0] if conditions else None
+        noise = self.rng.normal(tf.shape(noise)[1:])
+        gradients, loss = self.generator_gradients_fn(noise, conditions)
+        self.generator_optimizer.apply_gradients(zip(gradients, self.generator.trainable_variables))
+        return loss
+
+    def train_step(self, iterator):
+        if self.compile_time is not None:
+            return self.step_fn(iterator)
+
+        # The first call traces and compiles the step. XLA reports ops it cannot compile
+        # when the step runs, after the batch has been drawn, so the fallback step simply
+        # trains on the next one.
+        start = time.time()
+        try:
+            outputs = self.step_fn(iterator)
+            block(outputs)
+        except (tf.errors.InvalidArgumentError, tf.errors.UnimplementedError) as error:
+            if not self.jit_compile:
+                raise
+            print("XLA could not compile the step, falling back to graph mode:")
+            print("\t{}".format(error.message.strip().splitlines()[0]))
+            self.build_step(False)
+            outputs = self.step_fn(iterator)
+            block(outputs)
+
+        self.compile_time = time.time() - start
+        return outputs
+
+    def distributed_step(self, iterator):
+        inputs = self.strategy.run(self.critic_inputs, args=(next(iterator),))
+
+        # training discriminator (critic): the loop runs in cross-replica context so every
+        # iteration is one all-reduced update; the first update is peeled out of the loop
+        # so the discriminator optimizer creates its slots outside the while loop body
+        d_outputs = reduce_mean(self.strategy, self.strategy.run(self.critic_step, args=(0,) + inputs))
+        for i in tf.range(1, self.critic_size):
+            critic_outputs = reduce_mean(self.strategy, self.strategy.run(self.critic_step, args=(i,) + inputs))
+            d_outputs = tuple(total + output for total, output in zip(d_outputs, critic_outputs))
+        d_outputs = tuple(total / tf.cast(self.critic_size, total.dtype) for total in d_outputs)
+
+        # training generator
+        g_loss = reduce_mean(self.strategy, self.strategy.run(self.generator_step, args=inputs))
+
+        self.step.assign_add(1)
+        outputs = (g_loss,) + d_outputs
+        self.metrics.update(outputs)
+        return outputs
+
+    def profiled_step(self, iterator):
+        # train_step split into its phases, each waited for so the timers measure it
+        profiler = self.profiler
+        with profiler.timer('data'):
+            inputs = self.data_fn(iterator)
+            block(inputs)
+
+        d_outputs = []
+        for i in range(int(self.critic_size.numpy())):
+            with profiler.timer('critic_{}'.format(i)):
+                d_outputs.append(self.critic_fn(tf.constant(i), inputs))
+                block(d_outputs[-1])
+        d_outputs = tuple(tf.reduce_mean(tf.stack(outputs), axis=0) for outputs in zip(*d_outputs))
+
+        with profiler.timer('generator'):
+            g_loss = self.generator_fn(inputs)
+            block(g_loss)
+
+        self.step.assign_add(1)
+        outputs = (g_loss,) + d_outputs
+        self.metrics.update(outputs)
+        return outputs
+
+    def train(self):
+        config = self.config
+        self.checkpoint.restore()
+        start = int(self.step.numpy())
+        # rows logged after the restored checkpoint are written again
+        self.metrics_writer.truncate(start)
+        if self.evaluator is not None:
+            self.fid_writer.truncate(start)
+        train_step = self.profiled_step if config.PROFILE else self.train_step
+        profiler = self.profiler
+
+        for epoch in range(start, config.EPOCHS):
+            profiler.step(epoch)
+            with profiler.trace(epoch):
+                train_step(self.iterator)
+
+            if (epoch + 1) % config.LOG_INTERVAL == 0:
+                with profiler.timer('log'):
+                    means = self.write_metrics(epoch+1)
+                self.log_progress(epoch+1, means)
+                self.log_timings(profiler.write(epoch+1))
+
+            if (epoch + 1) % config.SAMPLE_INTERVAL == 0:
+                with profiler.timer('sample'):
+                    self.sample_images(epoch+1)
+
+            if self.evaluator is not None and (epoch + 1) % config.FID_INTERVAL == 0:
+                with profiler.timer('evaluate'):
+                    self.evaluate(epoch+1)
+
+            with profiler.timer('checkpoint'):
+                self.checkpoint.maybe_save(epoch + 1)
+
+        self.checkpoint.save(config.EPOCHS)
+        self.checkpoint.close()
+        self.sample_writer.close()
+        self.metrics_writer.close()
+        profiler.close()
+
+        self.generate_progress_graph()
+        if config.EXPORT_DIR is not None:
+            self.export_generator(config.EXPORT_DIR)
+
+    def write_metrics(self, step):
+        # the only point where the losses are copied to the host
+        result = self.metrics.pop()
+        self.metrics_writer.write(step, result)
+        return {name: result[name]['mean'] for name in self.metrics.names}
+
+    def log_progress(self, epoch, means):
+        extra = "".join(" | {} - {:.4f}".format(name, means[name]) for name in self.metrics.names[2:])
+        print("Epoch {}/{} :".format(epoch, self.config.EPOCHS))
+        print("    [G Loss - {:.4f}]\t[D Loss - {:.4f}{}]".format(means['generator_loss'], means['discriminator_loss'], extra))
+
+    def log_timings(self, timings):
+        for name, timing in timings.items():
+            print("    {:<12} p50 {:8.2f}ms | p90 {:8.2f}ms | p99 {:8.2f}ms".format(
+                name, timing['p50_ms'], timing['p90_ms'], timing['p99_ms']))
+
+    def generate_progress_graph(self):
+        metrics = self.metrics_writer.read()
+        steps = metrics['step']
+
+        fig, axes = plt.subplots(1, 2, sharex=False, sharey=False, figsize=(24, 16))
+        axes[0].plot(steps, metrics['generator_loss_mean'], color='purple', label='Generator Loss')
+        axes[0].fill_between(steps, metrics['generator_loss_min'], metrics['generator_loss_max'], color='purple', alpha=0.2)
+        axes[1].plot(steps, metrics['discriminator_loss_mean'], color='b', label='Discriminator Loss')
+        axes[1].fill_between(steps, metrics['discriminator_loss_min'], metrics['discriminator_loss_max'], color='b', alpha=0.2)
+
+        axes[0].set_title("Generator Loss")
+        axes[1].set_title("Discriminator Loss")
+
+        axes[0].set_xlabel("Epochs")
+        axes[1].set_xlabel("Epochs")
+
+        axes[0].set_ylabel("Loss")
+        axes[1].set_ylabel("Loss")
+        plt.savefig('/content/progress_graph.png', bbox_inches='tight')
+        plt.close(fig)
+
+    def serving_metadata(self):
+        # how serve.py builds the generator inputs; conditional models add their conditioning
+        return {'model': type(self).__name__, 'latent_dim': self.config.LATENT_DIM, 'conditioning': None}
+
+    def export_generator(self, directory):
+        # the generator as a SavedModel plus serving.json, the input of serve.py
+        os.makedirs(directory, exist_ok=True)
+        self.generator.save(os.path.join(directory, 'generator'), include_optimizer=False)
+        with open(os.path.join(directory, 'serving.json'), 'w') as f:
+            json.dump(self.serving_metadata(), f, indent=2)
+        print("Exported generator to {}".format(directory))
+
+    def sample_inputs(self, count):
+        return tf.random.normal((count, self.config.LATENT_DIM))
+
+    @tf.function
+    def generate_samples(self, inputs):
+        return 0.5 * self.generator(inputs, training=False) + 0.5
+
+    def evaluation_inputs(self, count):
+        # generator inputs of the samples the FID is computed on
+        return self.sample_inputs(count)
+
+    @tf.function
+    def generate_evaluation_images(self, inputs):
+        return self.generator(inputs, training=False)
+
+    def evaluate(self, step):
+        fid = self.evaluator.evaluate(lambda count: self.generate_evaluation_images(self.evaluation_inputs(count)))
+        self.fid_writer.write(step, fid)
+        print("    [FID - {:.4f}]".format(fid))
+        return fid
+
+    def sample_images(self, epoch):
+        rows, cols = self.SAMPLE_GRID
+
+        # only the generator call runs here, the grid is drawn by the writer thread
+        fake_images = self.generate_samples(self.sample_inputs(rows * cols)).numpy()
+        self.sample_writer.submit(epoch, fake_images)
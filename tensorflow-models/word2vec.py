@@ -0,0 +1,59 @@
+import hashlib
+import os
+
+import numpy as np
+
+# bump whenever load_embedding_matrix changes what ends up in the cache
+CACHE_VERSION = 1
+
+
+def cache_path(cache_dir, model_path, word_index, num_words, embedding_dim):
+    # the key covers the source file (path, size, mtime) and the part of the vocabulary
+    # that gets an embedding row
+    stat = os.stat(model_path)
+    key = hashlib.sha1('{}:{}:{}:{}:{}:{}'.format(
+        os.path.abspath(model_path), stat.st_size, int(stat.st_mtime), num_words, embedding_dim, CACHE_VERSION).encode())
+    for word, i in sorted(word_index.items(), key=lambda item: item[1]):
+        if i < num_words:
+            key.update('{}\t{}\n'.format(word, i).encode())
+    return os.path.join(cache_dir, 'word2vec-{}.npy'.format(key.hexdigest()[:16]))
+
+
+def load_embedding_matrix(model_path, word_index, num_words, embedding_dim, cache_dir):
+    # Returns a float32 (num_words, embedding_dim) matrix whose row i is the vector of the
+    # word with index i, zeros for words missing from the model. The text model is read
+    # once as a stream and only the wanted rows are kept, so memory stays at the size of
+    # the matrix; the result is cached and memory mapped on later runs.
+    path = cache_path(cache_dir, model_path, word_index, num_words, embedding_dim)
+    if os.path.exists(path):
+        print("\tLoading cached embedding {}".format(path))
+        return np.load(path, mmap_mode='r')
+
+    wanted = {word: i for word, i in word_index.items() if i < num_words}
+    matrix = np.zeros((num_words, embedding_dim), dtype=np.float32)
+    found = set()
+
+    with open(model_path, errors='ignore') as f:
+        # the first line holds the vocabulary size and the dimension
+        next(f, None)
+        for line in f:
+            word, _, vector = line.rstrip().partition(' ')
+            i = wanted.get(word)
+            if i is None or i in found:
+                continue
+
+            vector = np.array(vector.split(), dtype=np.float32)
+            if vector.shape != (embedding_dim,):
+                continue
+
+            matrix[i] = vector
+            found.add(i)
+            if len(found) == len(wanted):
+                break
+
+    print("\tReplaced {} embedding vectors.".format(len(found)))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(path + '.tmp.npy', matrix)
+    os.replace(path + '.tmp.npy', path)
+    return matrix